@@ -1,68 +1,221 @@
 import streamlit as st
-import json
-from utils.scrape import get_text
-from utils.chunk import chunk_text
-from rag import build_index, retrieve, run_all_prompts
-
-def build_markdown(results):
-    """Convert JSON results to formatted markdown."""
-    md = "# Spanish Study Materials\n\n"
-
-    for name, output in results.items():
-        md += f"## {name.title()}\n\n"
-
-        try:
-            data = json.loads(output)
-
-            if name == "vocab" and "vocabulary" in data:
-                for item in data["vocabulary"]:
-                    md += f"- **{item.get('spanish', '')}** ({item.get('pos', '')}) - {item.get('english', '')}\n"
-                    if item.get('example'):
-                        md += f"  - *{item['example']}*\n"
-                md += "\n"
-
-            elif name == "questions" and "questions" in data:
-                for i, q in enumerate(data["questions"], 1):
-                    md += f"{i}. **Q:** {q.get('question', '')}\n"
-                    md += f"   **A:** {q.get('answer', '')}\n"
-                    md += f"   *Difficulty: {q.get('difficulty', '')}*\n\n"
-
-            elif name == "dialogue":
-                if "title" in data:
-                    md += f"**{data['title']}**\n\n"
-                if "lines" in data:
-                    for line in data["lines"]:
-                        md += f"**{line.get('speaker', '')}:** {line.get('es', '')}\n\n"
-                if "glossary" in data:
-                    md += "### Glossary\n\n"
-                    for word in data["glossary"]:
-                        md += f"- {word.get('spanish', '')} - {word.get('english', '')}\n"
-                md += "\n"
-
-            elif name == "studyplan" and "plan" in data:
-                plan = data["plan"]
-                if "vocabulary" in plan:
-                    md += "**Vocabulary:**\n"
-                    for word in plan["vocabulary"]:
-                        md += f"- {word}\n"
-                    md += "\n"
-                if "grammar" in plan:
-                    md += "**Grammar:**\n"
-                    for concept in plan["grammar"]:
-                        md += f"- {concept}\n"
-                    md += "\n"
-                if "activities" in plan:
-                    md += "**Activities:**\n"
-                    for activity in plan["activities"]:
-                        md += f"- {activity}\n"
-                    md += "\n"
-                if "timeline" in plan:
-                    md += f"**Timeline:** {plan['timeline']}\n\n"
-
-        except json.JSONDecodeError:
-            md += f"```\n{output}\n```\n\n"
-
-    return md
+import os
+import time
+from functools import wraps
+from utils.timing import record, since_start, timed, timing_report
+from utils.tracing import span
+
+script_started = time.perf_counter()
+
+with timed("import app modules"):
+    from utils.scrape import get_text
+    from utils.chunk import chunk_text
+    from rag import build_index, choose_top_k, retrieve_multi, load_queries, merge_hits, run_all_prompts, stream_all_prompts, get_library, add_to_library, retrieve_from_library, warm_up, embedding_stats, estimate_input_tokens, repair_output
+    from utils.render import build_markdown
+    from models import parse_results
+    from rag import get_sentence_feedback, get_comprehension_feedback, grade_comprehension_answers
+
+# Load the embedding model off the request path; only the first run in a process starts it
+warm_up()
+
+def render_streamed_results(events):
+    """Render vocabulary, questions and dialogue lines as they stream in.
+
+    Consumes the events from stream_all_prompts and returns the final
+    ``{name: output}`` results dict once every prompt has finished.
+    """
+    sections = {
+        "vocabulary": ("### 📚 Vocabulary", lambda item: f"- **{item.get('spanish', '')}** ({item.get('pos', '')}) - {item.get('english', '')}"),
+        "questions": ("### 📖 Comprehension Questions", lambda item: f"- {item.get('question', '')}"),
+        "lines": ("### 💬 Dialogue", lambda item: f"**{item.get('speaker', '')}:** {item.get('es', '')}"),
+    }
+    placeholders = {key: st.empty() for key in sections}
+    received = {key: [] for key in sections}
+    results = {}
+
+    for kind, name, value in events:
+        if kind == "item":
+            key, item = value
+            received[key].append(sections[key][1](item))
+            placeholders[key].markdown(sections[key][0] + "\n\n" + "\n\n".join(received[key]))
+        else:
+            results[name] = value
+
+    for placeholder in placeholders.values():
+        placeholder.empty()
+    return results
+
+def log_run_time(name, seconds):
+    """Keep the most recent script and fragment run times for the timings panel."""
+    runs = st.session_state.setdefault("run_times", [])
+    runs.append((name, seconds * 1000))
+    del runs[:-20]
+    if os.getenv("SHOW_TIMINGS"):
+        print(f"[run] {name}: {seconds * 1000:.1f} ms")
+
+def measured(name):
+    """Record how long each run of the decorated fragment takes."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                log_run_time(name, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+def show_card(offset):
+    st.session_state.card_index += offset
+    st.session_state.show_answer = False
+
+def flip_card():
+    st.session_state.show_answer = not st.session_state.show_answer
+
+def know_card(original_index):
+    st.session_state.known_cards.add(original_index)
+    st.session_state.remaining_cards.remove(original_index)
+    # Stay on the same index position (the next card will shift into this position)
+    st.session_state.show_answer = False
+
+@st.fragment
+@measured("fragment: flashcards")
+def flashcard_deck(all_vocab, level, test_mode):
+    """Flashcards plus practice sentence; a click here reruns only this fragment."""
+    # Original indices of the cards not yet known, kept up to date by "Know It"
+    remaining_cards = st.session_state.remaining_cards
+    total_original = len(all_vocab)
+    total_remaining = len(remaining_cards)
+
+    # Check if all cards are mastered
+    if total_remaining == 0:
+        st.success("🎉 Congratulations! You've mastered all vocabulary words!")
+        st.balloons()
+        return
+
+    # Make sure card_index is valid
+    if st.session_state.card_index >= total_remaining:
+        st.session_state.card_index = 0
+
+    # Get current card and its original index
+    original_index = remaining_cards[st.session_state.card_index]
+    current_card = all_vocab[original_index]
+
+    # Progress indicator
+    progress = len(st.session_state.known_cards) / total_original
+    st.progress(progress)
+    st.caption(f"Card {st.session_state.card_index + 1}/{total_remaining}  •  {len(st.session_state.known_cards)}/{total_original} mastered")
+
+    # Flashcard container
+    with st.container():
+        st.markdown(f"""
+        <div style="
+            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+            padding: 40px 30px;
+            border-radius: 15px;
+            text-align: center;
+            height: 200px;
+            max-width: 500px;
+            margin: 20px auto;
+            display: flex;
+            flex-direction: column;
+            justify-content: center;
+            box-shadow: 0 8px 20px rgba(0,0,0,0.2);
+            overflow: hidden;
+        ">
+            <h1 style="color: white; font-size: 2.2em; margin: 0;">
+                {current_card.spanish if not st.session_state.show_answer else f'{current_card.english} <span style="color: #e0e0e0; font-size: 0.5em;">({current_card.pos})</span>'}
+            </h1>
+            {f'<p style="color: white; font-size: 0.95em; margin-top: 15px; font-style: italic;">"{current_card.example}"</p>' if st.session_state.show_answer and current_card.example else ''}
+        </div>
+        """, unsafe_allow_html=True)
+
+    # Controls; the callbacks update state before the fragment reruns
+    col1, col2, col3, col4 = st.columns([1, 1, 1, 1])
+    col1.button("◀ Previous", disabled=st.session_state.card_index == 0, on_click=show_card, args=(-1,))
+    col2.button("🔄 Flip Card", on_click=flip_card)
+    col3.button("✓ Know It", on_click=know_card, args=(original_index,))
+    col4.button("Next ▶", disabled=st.session_state.card_index == total_remaining - 1, on_click=show_card, args=(1,))
+
+    practice_sentence(current_card, level, test_mode)
+
+@st.fragment
+@measured("fragment: practice feedback")
+def practice_sentence(current_card, level, test_mode):
+    """Practice-sentence box; asking for feedback reruns only this fragment."""
+    # Initialize session state for practice
+    if 'practice_sentence' not in st.session_state:
+        st.session_state.practice_sentence = ""
+    if 'practice_feedback' not in st.session_state:
+        st.session_state.practice_feedback = None
+
+    practice_input = st.text_area(
+        f"Try using **{current_card.spanish}** in a sentence in Spanish:",
+        value=st.session_state.practice_sentence,
+        height=80,
+        placeholder=f"Example: {current_card.example or 'Write a sentence...'}"
+    )
+
+    if st.button("Get Feedback"):
+        if practice_input.strip():
+            st.session_state.practice_sentence = practice_input
+            # Get feedback from LLM; a failure (rate limits, timeout) is shown rather than raised
+            try:
+                st.session_state.practice_feedback = get_sentence_feedback(
+                    practice_input,
+                    current_card.spanish,
+                    level,
+                    test_mode
+                )
+            except Exception as e:
+                st.error(f"Couldn't get feedback right now, please try again: {e}")
+        else:
+            st.warning("Please write a sentence first!")
+
+    # Display feedback
+    if st.session_state.practice_feedback:
+        st.markdown("#### 📝 Feedback")
+        st.info(st.session_state.practice_feedback)
+
+@st.fragment
+@measured("fragment: comprehension question")
+def comprehension_question(i, q, level, test_mode):
+    """One comprehension question with its own answer box and feedback."""
+    st.markdown(f"**({q.difficulty.capitalize()}):** {q.question}")
+
+    # Answer input
+    user_answer = st.text_area(
+        "Your answer:",
+        value=st.session_state.comp_answers.get(i, ""),
+        height=60,
+        key=f"comp_answer_{i}",
+        placeholder="Write your answer in Spanish..."
+    )
+
+    # Feedback button
+    if st.button("Get Feedback", key=f"feedback_btn_{i}"):
+        if user_answer.strip():
+            st.session_state.comp_answers[i] = user_answer
+            # Get feedback from LLM; a failure (rate limits, timeout) is shown rather than raised
+            try:
+                st.session_state.comp_feedback[i] = get_comprehension_feedback(
+                    q.question,
+                    user_answer,
+                    q.answer,
+                    level,
+                    test_mode
+                )
+            except Exception as e:
+                st.error(f"Couldn't get feedback right now, please try again: {e}")
+        else:
+            st.warning(f"Please write an answer for Question {i+1} first!")
+
+    # Display feedback if available
+    if i in st.session_state.comp_feedback:
+        st.info(st.session_state.comp_feedback[i])
+
+    st.markdown("")  # Add spacing
 
 st.set_page_config(page_title="Hola Mundo", page_icon="👋")
 st.title("Hola Mundo: Spanish Study Companion")
@@ -70,11 +223,58 @@ st.title("Hola Mundo: Spanish Study Companion")
 # Initialize session state for results
 if 'results' not in st.session_state:
     st.session_state.results = None
+if 'materials' not in st.session_state:
+    st.session_state.materials = None
 if 'markdown_content' not in st.session_state:
     st.session_state.markdown_content = None
+# Library articles this session added; only these can be deleted from here
+if 'library_added' not in st.session_state:
+    st.session_state.library_added = set()
+
+# Library of every web article studied so far, shared by all sessions.
+# Pasted text is private to the session that pasted it, so it never goes in.
+with st.sidebar:
+    st.markdown("### 📚 Library")
+    # Libraries from before pasted text was kept out may still hold "text:" entries
+    library_articles = [a for a in get_library().articles() if not a["source"].startswith("text:")]
+    if not library_articles:
+        st.caption("Web articles studied here will appear here.")
+    else:
+        library_query = st.text_input("Search the library")
+        library_filter = st.selectbox("In", ["All articles"] + [a["source"] for a in library_articles])
+        if library_query.strip():
+            article = None if library_filter == "All articles" else library_filter
+            hits = [h for h in retrieve_from_library(library_query, k=5, article=article) if not h["source"].startswith("text:")]
+            for hit in hits:
+                st.markdown(f"**{hit['source']}** (score {hit['score']:.2f})")
+                st.caption(hit["text"][:300] + ("…" if len(hit["text"]) > 300 else ""))
+        for a in library_articles:
+            col_source, col_delete = st.columns([4, 1])
+            col_source.caption(f"{a['source']} • {a['chunks']} sections")
+            if a["source"] in st.session_state.library_added and col_delete.button("🗑", key=f"delete_article_{a['id']}"):
+                get_library().delete_article(a["source"])
+                st.session_state.library_added.discard(a["source"])
+                st.rerun()
+
+    if os.getenv("SHOW_TIMINGS"):
+        with st.expander("⏱ Startup timings"):
+            for name, seconds in timing_report().items():
+                st.caption(f"{name}: {seconds:.3f}s")
+        embedding = embedding_stats()
+        if embedding:
+            with st.expander("⏱ Embedding service"):
+                for name, value in embedding.items():
+                    st.caption(f"{name}: {value:.1f}" if isinstance(value, float) else f"{name}: {value}")
+        with st.expander("⏱ Recent run times"):
+            # Full-script reruns vs. fragment-only reruns, most recent last
+            for name, ms in st.session_state.get("run_times", []):
+                st.caption(f"{name}: {ms:.1f} ms")
 
 level = st.selectbox("Your Spanish Level", ["A1", "A2", "B1", "B2", "C1", "C2"], index=2)
 test_mode = st.checkbox("🧪 Test Mode (skip LLM calls)", value=False)
+stream_mode = st.checkbox("⚡ Show materials as they are generated", value=True)
+combined_mode = st.checkbox("📦 Generate all materials in one request (sends the article once)", value=False)
+generation_mode = "combined" if combined_mode else "separate"
 url = st.text_input("Spanish article URL")
 text = st.text_area("Or paste text", height=160)
 
@@ -83,270 +283,156 @@ if st.button("Generate Study Materials"):
     if not source:
         st.warning("Please provide a URL or some text")
         st.stop()
-
-    progress_bar = st.progress(0)
-    status_text = st.empty()
-
-    # Step 1: Scrape
-    status_text.text("Scraping Spanish text...")
-    scraped = get_text(source)
-    progress_bar.progress(20)
-
-    # Step 2: Chunk
-    status_text.text("Processing content...")
-    chunks = chunk_text(scraped)
-    progress_bar.progress(40)
-
-    # Auto-calculate optimal number of chunks to retrieve
-    total_chunks = len(chunks)
-    top_k = min(max(int(total_chunks * 0.6), 3), 8)  # 60% of chunks, min 3, max 8
-
-    # Step 3: Build index
-    status_text.text("Organizing for analysis...")
-    index, _ = build_index(chunks)
-    progress_bar.progress(60)
-
-    # Step 4: Retrieve
-    status_text.text("Finding key sections...")
-    query = "vocabulary and grammar concepts"
-    hits = retrieve(chunks, index, query, k=top_k)
-    progress_bar.progress(80)
-
-    # Step 5: Generate
-    status_text.text("Generating study materials...")
-    st.session_state.results = run_all_prompts(hits, level=level, test_mode=test_mode)
-    progress_bar.progress(100)
-
-    # Clear progress and show summary
-    progress_bar.empty()
-    status_text.empty()
-
-    st.success(f"✅ Successfully processed Spanish article  •  {len(scraped):,} characters analyzed  •  {len(hits)} sections identified")
-
-    # Build markdown
-    st.session_state.markdown_content = build_markdown(st.session_state.results)
+    request_started = time.perf_counter()
+
+    # One trace per request; stage spans and every LLM call nest under it
+    with span("request", level=level, test_mode=test_mode):
+        progress_bar = st.progress(0)
+        status_text = st.empty()
+
+        # Step 1: Scrape
+        status_text.text("Scraping Spanish text...")
+        with span("scrape", url=source.startswith("http")):
+            scraped = get_text(source)
+        progress_bar.progress(20)
+
+        # Step 2: Chunk
+        status_text.text("Processing content...")
+        with span("chunk", chars=len(scraped)) as stage:
+            chunks = chunk_text(scraped)
+            stage.set(chunks=len(chunks))
+        progress_bar.progress(40)
+
+        # Auto-calculate optimal number of chunks to retrieve
+        total_chunks = len(chunks)
+        top_k = choose_top_k(total_chunks)
+
+        # Step 3: Build index
+        status_text.text("Organizing for analysis...")
+        with span("build_index", chunks=len(chunks)):
+            index, vecs = build_index(chunks)
+            if not text.strip():
+                add_to_library(url.strip(), chunks, vecs)
+                st.session_state.library_added.add(url.strip())
+        progress_bar.progress(60)
+
+        # Step 4: Retrieve, with each prompt's own query from prompts/queries.json
+        status_text.text("Finding key sections...")
+        with span("retrieve", k=top_k):
+            hits = retrieve_multi(chunks, index, load_queries(), k=top_k, vecs=vecs)
+        progress_bar.progress(80)
+
+        # Step 5: Generate
+        status_text.text("Generating study materials...")
+        with span("generate", mode=generation_mode, stream=stream_mode):
+            if stream_mode:
+                st.session_state.results = render_streamed_results(stream_all_prompts(hits, level=level, test_mode=test_mode, source_text=scraped, mode=generation_mode))
+            else:
+                st.session_state.results = run_all_prompts(hits, level=level, test_mode=test_mode, source_text=scraped, mode=generation_mode)
+        progress_bar.progress(100)
+
+        if "first request" not in timing_report():
+            record("first request", time.perf_counter() - request_started)
+            print("Startup timings (s):", {name: round(t, 3) for name, t in timing_report().items()})
+
+        # Clear progress and show summary
+        progress_bar.empty()
+        status_text.empty()
+
+        st.success(f"✅ Successfully processed Spanish article  •  {len(scraped):,} characters analyzed  •  {len(merge_hits(hits))} sections identified")
+        input_tokens = estimate_input_tokens(hits, level=level, source_text=scraped)
+        st.caption(f"≈{input_tokens[generation_mode]:,} input tokens sent"
+                   + (f" ({input_tokens['saved']:,} fewer than one request per material)" if combined_mode else ""))
+
+        # Parse and validate every payload once; the UI and markdown read from these objects
+        with span("parse") as stage:
+            st.session_state.materials = parse_results(
+                st.session_state.results,
+                reask=lambda name, output, error: repair_output(name, output, error, test_mode),
+            )
+            stage.set(errors=len(st.session_state.materials.errors))
+
+        # Build markdown
+        st.session_state.markdown_content = build_markdown(st.session_state.materials)
 
     # Reset flashcard state when new materials are generated
     st.session_state.card_index = 0
     st.session_state.show_answer = False
     st.session_state.known_cards = set()
+    vocab = st.session_state.materials.vocab
+    st.session_state.remaining_cards = list(range(len(vocab.vocabulary))) if vocab else []
 
 # Display results if they exist
-if st.session_state.results:
+materials = st.session_state.materials
+if materials:
+    for name, error in materials.errors.items():
+        st.warning(f"Couldn't read the generated {name}: {error}")
+
     # Flashcard mode for vocabulary
-    if "vocab" in st.session_state.results:
+    if materials.vocab:
         st.markdown("### 📚 Vocabulary Flashcards")
-        try:
-            vocab_data = json.loads(st.session_state.results["vocab"])
-            if "vocabulary" in vocab_data:
-                all_vocab = vocab_data["vocabulary"]
-
-                # Initialize session state
-                if 'card_index' not in st.session_state:
-                    st.session_state.card_index = 0
-                if 'show_answer' not in st.session_state:
-                    st.session_state.show_answer = False
-                if 'known_cards' not in st.session_state:
-                    st.session_state.known_cards = set()
-
-                # Filter out known cards and keep track of original indices
-                vocab_with_indices = [(i, card) for i, card in enumerate(all_vocab) if i not in st.session_state.known_cards]
-                total_original = len(all_vocab)
-                total_remaining = len(vocab_with_indices)
-
-                # Check if all cards are mastered
-                if total_remaining == 0:
-                    st.success("🎉 Congratulations! You've mastered all vocabulary words!")
-                    st.balloons()
-                else:
-                    # Make sure card_index is valid
-                    if st.session_state.card_index >= total_remaining:
-                        st.session_state.card_index = 0
-
-                    # Get current card and its original index
-                    original_index, current_card = vocab_with_indices[st.session_state.card_index]
-
-                    # Progress indicator
-                    progress = len(st.session_state.known_cards) / total_original
-                    st.progress(progress)
-                    st.caption(f"Card {st.session_state.card_index + 1}/{total_remaining}  •  {len(st.session_state.known_cards)}/{total_original} mastered")
-
-                    # Flashcard container
-                    with st.container():
-                        st.markdown(f"""
-                        <div style="
-                            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                            padding: 40px 30px;
-                            border-radius: 15px;
-                            text-align: center;
-                            height: 200px;
-                            max-width: 500px;
-                            margin: 20px auto;
-                            display: flex;
-                            flex-direction: column;
-                            justify-content: center;
-                            box-shadow: 0 8px 20px rgba(0,0,0,0.2);
-                            overflow: hidden;
-                        ">
-                            <h1 style="color: white; font-size: 2.2em; margin: 0;">
-                                {current_card['spanish'] if not st.session_state.show_answer else f'{current_card["english"]} <span style="color: #e0e0e0; font-size: 0.5em;">({current_card["pos"]})</span>'}
-                            </h1>
-                            {f'<p style="color: white; font-size: 0.95em; margin-top: 15px; font-style: italic;">"{current_card.get("example", "")}"</p>' if st.session_state.show_answer and current_card.get("example") else ''}
-                        </div>
-                        """, unsafe_allow_html=True)
-
-                    # Controls
-                    col1, col2, col3, col4 = st.columns([1, 1, 1, 1])
-
-                    with col1:
-                        if st.button("◀ Previous", disabled=st.session_state.card_index == 0):
-                            st.session_state.card_index -= 1
-                            st.session_state.show_answer = False
-                            st.rerun()
-
-                    with col2:
-                        if st.button("🔄 Flip Card"):
-                            st.session_state.show_answer = not st.session_state.show_answer
-                            st.rerun()
-
-                    with col3:
-                        if st.button("✓ Know It"):
-                            st.session_state.known_cards.add(original_index)
-                            # Stay on the same index position (the next card will shift into this position)
-                            st.session_state.show_answer = False
-                            st.rerun()
-
-                    with col4:
-                        if st.button("Next ▶", disabled=st.session_state.card_index == total_remaining - 1):
-                            st.session_state.card_index += 1
-                            st.session_state.show_answer = False
-                            st.rerun()
-
-                    # Practice sentence input
-                    # Initialize session state for practice
-                    if 'practice_sentence' not in st.session_state:
-                        st.session_state.practice_sentence = ""
-                    if 'practice_feedback' not in st.session_state:
-                        st.session_state.practice_feedback = None
-
-                    practice_input = st.text_area(
-                        f"Try using **{current_card['spanish']}** in a sentence in Spanish:",
-                        value=st.session_state.practice_sentence,
-                        height=80,
-                        placeholder=f"Example: {current_card.get('example', 'Write a sentence...')}"
-                    )
-
-                    if st.button("Get Feedback"):
-                        if practice_input.strip():
-                            st.session_state.practice_sentence = practice_input
-                            # Get feedback from LLM
-                            from rag import get_sentence_feedback
-                            st.session_state.practice_feedback = get_sentence_feedback(
-                                practice_input,
-                                current_card['spanish'],
-                                level,
-                                test_mode
-                            )
-                            st.rerun()
-                        else:
-                            st.warning("Please write a sentence first!")
-
-                    # Display feedback
-                    if st.session_state.practice_feedback:
-                        feedback = st.session_state.practice_feedback
-                        st.markdown("#### 📝 Feedback")
-                        st.info(feedback)
-
-                    st.markdown("---")
-
-                    # Comprehension Questions Section
-                    if "questions" in st.session_state.results:
-                        st.markdown("### 📖 Comprehension Questions")
-                        try:
-                            questions_data = json.loads(st.session_state.results["questions"])
-                            if "questions" in questions_data:
-                                all_questions = questions_data["questions"]
-
-                                # Get one question of each difficulty
-                                difficulties = ["beginner", "intermediate", "advanced"]
-                                selected_questions = []
-                                for diff in difficulties:
-                                    for q in all_questions:
-                                        if q.get("difficulty", "").lower() == diff:
-                                            selected_questions.append(q)
-                                            break
-
-                                # Initialize session state for comprehension answers
-                                if 'comp_answers' not in st.session_state:
-                                    st.session_state.comp_answers = {}
-                                if 'comp_feedback' not in st.session_state:
-                                    st.session_state.comp_feedback = {}
-
-                                # Display questions
-                                for i, q in enumerate(selected_questions):
-                                    difficulty = q.get("difficulty", "intermediate")
-                                    question = q.get("question", "")
-
-                                    st.markdown(f"**({difficulty.capitalize()}):** {question}")
-
-                                    # Answer input
-                                    answer_key = f"comp_answer_{i}"
-                                    user_answer = st.text_area(
-                                        "Your answer:",
-                                        value=st.session_state.comp_answers.get(i, ""),
-                                        height=60,
-                                        key=answer_key,
-                                        placeholder="Write your answer in Spanish..."
-                                    )
-
-                                    # Feedback button
-                                    if st.button("Get Feedback", key=f"feedback_btn_{i}"):
-                                        if user_answer.strip():
-                                            st.session_state.comp_answers[i] = user_answer
-                                            # Get feedback from LLM
-                                            from rag import get_comprehension_feedback
-                                            st.session_state.comp_feedback[i] = get_comprehension_feedback(
-                                                question,
-                                                user_answer,
-                                                q.get("answer", ""),
-                                                level,
-                                                test_mode
-                                            )
-                                            st.rerun()
-                                        else:
-                                            st.warning(f"Please write an answer for Question {i+1} first!")
-
-                                    # Display feedback if available
-                                    if i in st.session_state.comp_feedback:
-                                        st.info(st.session_state.comp_feedback[i])
-
-                                    st.markdown("")  # Add spacing
-
-                        except json.JSONDecodeError:
-                            pass
-
-                    st.markdown("---")
-
-                    # Dialogue Section
-                    if "dialogue" in st.session_state.results:
-                        st.markdown("### 💬 Dialogue")
-                        try:
-                            dialogue_data = json.loads(st.session_state.results["dialogue"])
-
-                            if "title" in dialogue_data:
-                                st.markdown(f"**{dialogue_data['title']}**")
-
-                            # Display dialogue lines
-                            if "lines" in dialogue_data:
-                                for line in dialogue_data["lines"]:
-                                    speaker = line.get("speaker", "")
-                                    text = line.get("es", "")
-                                    st.markdown(f"**{speaker}:** {text}")
-
-                        except json.JSONDecodeError:
-                            pass
-
-                    st.markdown("---")
-        except json.JSONDecodeError:
-            pass
-
+        all_vocab = materials.vocab.vocabulary
+
+        # Initialize session state
+        if 'card_index' not in st.session_state:
+            st.session_state.card_index = 0
+        if 'show_answer' not in st.session_state:
+            st.session_state.show_answer = False
+        if 'known_cards' not in st.session_state:
+            st.session_state.known_cards = set()
+        if 'remaining_cards' not in st.session_state:
+            st.session_state.remaining_cards = [i for i in range(len(all_vocab)) if i not in st.session_state.known_cards]
+
+        flashcard_deck(all_vocab, level, test_mode)
+        st.markdown("---")
+
+    # Comprehension Questions Section
+    if materials.questions:
+        st.markdown("### 📖 Comprehension Questions")
+
+        # Initialize session state for comprehension answers
+        if 'comp_answers' not in st.session_state:
+            st.session_state.comp_answers = {}
+        if 'comp_feedback' not in st.session_state:
+            st.session_state.comp_feedback = {}
+
+        # One question of each difficulty, each rerunning independently
+        selected_questions = materials.questions.one_per_difficulty()
+        for i, q in enumerate(selected_questions):
+            comprehension_question(i, q, level, test_mode)
+
+        # Grade every written answer in one request
+        if st.button("📝 Grade All Answers"):
+            answered = [(i, q, st.session_state.get(f"comp_answer_{i}", "")) for i, q in enumerate(selected_questions)]
+            answered = [(i, q, answer) for i, q, answer in answered if answer.strip()]
+            if answered:
+                feedback = grade_comprehension_answers(
+                    [(q.question, answer, q.answer) for _, q, answer in answered],
+                    level,
+                    test_mode
+                )
+                for (i, _, answer), text in zip(answered, feedback):
+                    st.session_state.comp_answers[i] = answer
+                    st.session_state.comp_feedback[i] = text
+                st.rerun()
+            else:
+                st.warning("Please write at least one answer first!")
+
+        st.markdown("---")
+
+    # Dialogue Section
+    if materials.dialogue:
+        st.markdown("### 💬 Dialogue")
+        dialogue = materials.dialogue
+
+        if dialogue.title:
+            st.markdown(f"**{dialogue.title}**")
+
+        # Display dialogue lines
+        for line in dialogue.lines:
+            st.markdown(f"**{line.speaker}:** {line.es}")
+
+        st.markdown("---")
+
+record("first script run", since_start())
+log_run_time("full script", time.perf_counter() - script_started)
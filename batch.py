@@ -0,0 +1,184 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from llm import call_llm
+from models import GenerationFailed, parse_results
+from rag import EMBED_BACKEND, EMBED_BATCH_SIZE, EMBED_MODEL, EMBED_THREADS, MAX_CONTEXT_TOKENS, build_index, build_prompt, assemble_contexts, choose_top_k, get_embedding_store, load_prompts, load_queries, repair_output, search_multi
+from utils.chunk import chunk_text
+from utils.render import build_markdown
+from utils.scrape import get_texts
+from utils.tracing import span
+
+_worker_model = None
+
+def _init_worker(backend, model_name, batch_size, threads):
+    global _worker_model
+    from utils.embedders import make_backend
+    _worker_model = make_backend(backend, model_name, batch_size=batch_size, threads=threads)
+
+def _encode_batch(texts):
+    return _worker_model.encode(texts, normalize_embeddings=True)
+
+def read_items(path):
+    """Read ``{"id", "url"|"text"}`` records from a JSONL file.
+
+    Records without an ``id`` get one derived from their source, so reruns on
+    the same file resolve to the same checkpoint entries.
+    """
+    items = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            source = record.get("url") or record.get("text") or record.get("source") or ""
+            item_id = str(record.get("id") or hashlib.sha1(source.encode("utf-8")).hexdigest()[:16])
+            items.append({"id": item_id, "source": source})
+    return items
+
+def load_checkpoint(out_dir):
+    path = Path(out_dir) / "checkpoint.jsonl"
+    if not path.exists():
+        return set()
+    with open(path) as f:
+        return {json.loads(line)["id"] for line in f if line.strip()}
+
+def write_outputs(out_dir, item_id, materials):
+    """Write an item's JSON and markdown outputs and mark it done in the checkpoint.
+
+    Items with a failed prompt or an unparseable payload are written but not
+    checkpointed, so the next run retries them. Returns True if checkpointed.
+    """
+    out_dir = Path(out_dir)
+    for suffix, content in ((".json", materials.model_dump_json(indent=2)), (".md", build_markdown(materials))):
+        tmp = out_dir / f"{item_id}{suffix}.tmp"
+        tmp.write_text(content, encoding="utf-8")
+        os.replace(tmp, out_dir / f"{item_id}{suffix}")
+    if materials.errors:
+        return False
+    with open(out_dir / "checkpoint.jsonl", "a") as f:
+        f.write(json.dumps({"id": item_id}) + "\n")
+    return True
+
+def scrape_all(items, workers):
+    """Fetch every item's text concurrently; failed items come back as None."""
+    texts = get_texts([item["source"] for item in items], max_workers=workers, return_exceptions=True)
+    for item, text in zip(items, texts):
+        if isinstance(text, Exception):
+            print(f"[{item['id']}] scrape failed: {text}")
+    return [None if isinstance(text, Exception) else text for text in texts]
+
+def pooled_encoder(pool, batch_size):
+    """Encode function for the embedding store that fans batches out to the worker pool."""
+    def encode(texts):
+        batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+        return np.vstack(list(pool.map(_encode_batch, batches)))
+    return encode
+
+async def generate_all(jobs, level, test_mode, concurrency):
+    """Run every (item, prompt) LLM call with at most ``concurrency`` in flight.
+
+    ``jobs`` maps item ids to ``{prompt name: context}``; yields
+    ``(item_id, results)`` as each item's prompts complete.
+    """
+    prompts = load_prompts()
+    slots = asyncio.Semaphore(concurrency)
+
+    async def run_prompt(item_id, contexts, name, template):
+        context = contexts[name]
+        async with slots:
+            try:
+                with span("prompt", prompt=name, item=item_id):
+                    return name, await asyncio.to_thread(call_llm, build_prompt(context, level, template), test_mode=test_mode)
+            except Exception as e:
+                return name, GenerationFailed(f"Error generating {name}: {e}")
+
+    async def run_item(item_id, contexts):
+        outputs = await asyncio.gather(*(run_prompt(item_id, contexts, name, t) for name, t in prompts.items()))
+        return item_id, dict(outputs)
+
+    for done in asyncio.as_completed([run_item(item_id, contexts) for item_id, contexts in jobs.items()]):
+        yield await done
+
+async def run_batch(items, out_dir, level="B1", test_mode=False, concurrency=8, scrape_workers=16,
+                    embed_workers=2, embed_batch_size=256, batch_size=50):
+    """Generate study materials for every item not yet in the checkpoint."""
+    Path(out_dir).mkdir(parents=True, exist_ok=True)
+    done = load_checkpoint(out_dir)
+    pending = [item for item in items if item["id"] not in done]
+    print(f"{len(items)} items, {len(items) - len(pending)} already done, {len(pending)} to go")
+    if not pending:
+        return
+
+    store = get_embedding_store()
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=embed_workers, mp_context=ctx, initializer=_init_worker,
+                             initargs=(EMBED_BACKEND, EMBED_MODEL, EMBED_BATCH_SIZE, EMBED_THREADS)) as pool:
+        encode = pooled_encoder(pool, embed_batch_size)
+        prompts = load_prompts()
+        queries = load_queries()
+        qv = encode([queries[name] for name in prompts])
+
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            with span("batch", items=len(batch)):
+                with span("scrape"):
+                    texts = await asyncio.to_thread(scrape_all, batch, scrape_workers)
+
+                with span("embed") as stage:
+                    chunked = [(item, text, chunk_text(text)) for item, text in zip(batch, texts) if text]
+                    # One store lookup for the whole batch, so unseen chunks are encoded together
+                    store.get_or_compute([c["text"] for _, _, chunks in chunked for c in chunks], encode)
+                    stage.set(chunks=sum(len(chunks) for _, _, chunks in chunked))
+
+                jobs = {}
+                with span("retrieve"):
+                    for item, text, chunks in chunked:
+                        index, vecs = build_index(chunks)
+                        hits = search_multi(chunks, index, qv, list(prompts), choose_top_k(len(chunks)), vecs)
+                        jobs[item["id"]], _ = assemble_contexts(hits, prompts, text, MAX_CONTEXT_TOKENS)
+
+                reask = lambda name, output, error: repair_output(name, output, error, test_mode)
+                with span("generate"):
+                    async for item_id, results in generate_all(jobs, level, test_mode, concurrency):
+                        materials = await asyncio.to_thread(parse_results, results, reask)
+                        if write_outputs(out_dir, item_id, materials):
+                            print(f"[{item_id}] done")
+                        else:
+                            print(f"[{item_id}] incomplete, will retry next run: {', '.join(sorted(materials.errors))}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-generate Spanish study materials for a JSONL file of URLs or texts.")
+    parser.add_argument("input", help='JSONL file with one {"id": ..., "url": ...} or {"id": ..., "text": ...} per line')
+    parser.add_argument("--out", default="output", help="directory for <id>.json, <id>.md and checkpoint.jsonl")
+    parser.add_argument("--level", default="B1")
+    parser.add_argument("--test-mode", action="store_true", help="use mock LLM responses")
+    parser.add_argument("--concurrency", type=int, default=8, help="max LLM calls in flight")
+    parser.add_argument("--scrape-workers", type=int, default=16)
+    parser.add_argument("--embed-workers", type=int, default=2)
+    parser.add_argument("--embed-batch-size", type=int, default=256)
+    parser.add_argument("--batch-size", type=int, default=50, help="items per scrape/embed/generate round")
+    args = parser.parse_args(argv)
+
+    asyncio.run(run_batch(
+        read_items(args.input),
+        args.out,
+        level=args.level,
+        test_mode=args.test_mode,
+        concurrency=args.concurrency,
+        scrape_workers=args.scrape_workers,
+        embed_workers=args.embed_workers,
+        embed_batch_size=args.embed_batch_size,
+        batch_size=args.batch_size,
+    ))
+
+if __name__ == "__main__":
+    main()
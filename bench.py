@@ -0,0 +1,222 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+SIZES = {"1k": 1_000, "16k": 16_000, "256k": 256_000, "book": 1_000_000}
+
+SUBJECTS = ["La ciudad", "Mi hermana", "El gobierno", "Los estudiantes", "Nuestro vecino", "La profesora", "El mercado", "Los turistas", "La empresa", "Mi abuelo"]
+VERBS = ["construye", "recuerda", "describe", "prepara", "visita", "critica", "necesita", "organiza", "descubre", "explica"]
+OBJECTS = ["un puente nuevo", "la historia del pueblo", "una receta tradicional", "el museo de arte", "las noticias de la mañana", "un viaje largo", "la reforma económica", "el partido de fútbol", "una canción antigua", "los precios del pan"]
+TAILS = ["cada domingo", "con mucha paciencia", "aunque llueva", "porque le gusta", "antes del verano", "sin decir nada", "para sus hijos", "desde hace años", "en la plaza mayor", "cuando tiene tiempo"]
+CONNECTORS = ["Sin embargo,", "Además,", "Por eso,", "Mientras tanto,", "Al final,", "De hecho,"]
+
+def spanish_corpus(n_bytes, seed=0):
+    """Deterministic Spanish-looking prose of about ``n_bytes`` UTF-8 bytes, in paragraphs."""
+    rng = random.Random(seed)
+    paragraphs, size = [], 0
+    while size < n_bytes:
+        sentences = []
+        for _ in range(rng.randint(3, 7)):
+            opener = f"{rng.choice(CONNECTORS)} " if rng.random() < 0.3 else ""
+            subject = rng.choice(SUBJECTS)
+            if opener:
+                subject = subject[0].lower() + subject[1:]
+            sentences.append(f"{opener}{subject} {rng.choice(VERBS)} {rng.choice(OBJECTS)} {rng.choice(TAILS)}.")
+        paragraphs.append(" ".join(sentences))
+        size += len(paragraphs[-1].encode("utf-8")) + 2
+    return "\n\n".join(paragraphs)[:n_bytes]
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+def measure(fn, setup=None, units=1, min_repeats=5, min_time=1.0, sample_time=0.02):
+    """Time ``fn(state)`` repeatedly, then once more under tracemalloc.
+
+    Like ``timeit``'s autorange, each sample times as many back-to-back calls
+    as it takes to fill ``sample_time`` seconds and records the per-call mean,
+    so sub-millisecond cases aren't dominated by timer and scheduling noise.
+    Samples are taken until there are ``min_repeats`` and ``min_time`` has
+    passed. ``setup()`` runs before every call, outside the timing, and its
+    return value is passed to ``fn``; cases with a setup are timed one call
+    per sample. ``units`` is the amount of work per call (bytes, chunks, ...),
+    used for throughput. Peak memory is the Python heap as seen by
+    tracemalloc (lowest of three runs), so native allocations in torch or
+    faiss are missed.
+    """
+    def sample(number):
+        state = setup() if setup else None
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn(state)
+        return time.perf_counter() - t0
+
+    number = 1
+    if setup is None:
+        while sample(number) < sample_time:
+            number *= 2
+
+    samples = []
+    started = time.perf_counter()
+    while len(samples) < min_repeats or time.perf_counter() - started < min_time:
+        samples.append(sample(number) / number)
+
+    # Lowest of a few traced runs, so stray garbage or a thread pool's warm-up doesn't count
+    peaks = []
+    for _ in range(3):
+        state = setup() if setup else None
+        tracemalloc.start()
+        try:
+            fn(state)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+    peak = min(peaks)
+
+    p50 = percentile(samples, 50)
+    return {
+        "repeats": len(samples),
+        "calls_per_sample": number,
+        "min_ms": min(samples) * 1000,
+        "p50_ms": p50 * 1000,
+        "p95_ms": percentile(samples, 95) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+        "throughput": units / p50 if p50 else float("inf"),
+        "peak_kb": peak / 1024,
+    }
+
+def corpus_cases(label, text, store_root):
+    """Cases that scale with the corpus: chunking, embedding, indexing and retrieval."""
+    from rag import build_index, choose_top_k, embed_chunks, get_embedding_store, load_queries, retrieve_multi
+    from utils.chunk import chunk_text
+
+    n_bytes = len(text.encode("utf-8"))
+    yield f"chunk_text[{label}]", "MB/s", lambda: measure(lambda _: chunk_text(text), units=n_bytes / 1e6)
+
+    chunks = chunk_text(text)
+    os.makedirs(store_root, exist_ok=True)
+
+    def fresh_store():
+        # A new, empty embedding store so every call pays for encoding
+        os.environ["EMBED_STORE_DIR"] = tempfile.mkdtemp(dir=store_root)
+        get_embedding_store.cache_clear()
+
+    def warm_store():
+        os.environ["EMBED_STORE_DIR"] = store_root
+        get_embedding_store.cache_clear()
+        embed_chunks(chunks)
+
+    yield f"embed_chunks[{label}]", "chunks/s", lambda: measure(lambda _: embed_chunks(chunks), setup=fresh_store, units=len(chunks))
+    yield f"build_index cached[{label}]", "chunks/s", lambda: measure(lambda _: build_index(chunks), setup=warm_store, units=len(chunks))
+
+    def indexed():
+        warm_store()
+        return build_index(chunks)
+
+    queries = load_queries()
+    k = choose_top_k(len(chunks))
+    yield f"retrieve_multi[{label}]", "queries/s", lambda: measure(
+        lambda state: retrieve_multi(chunks, state[0], queries, k=k, vecs=state[1]), setup=indexed, units=len(queries))
+
+def fixed_cases(level="B1"):
+    """Cases whose cost doesn't depend on corpus size: prompt loading, mock generation, parsing, rendering."""
+    from models import parse_results
+    from rag import load_prompts, run_all_prompts
+    from utils.chunk import chunk_text
+    from utils.render import build_markdown
+
+    chunks = chunk_text(spanish_corpus(SIZES["16k"]))
+    results = run_all_prompts(chunks, level=level, test_mode=True)
+    materials = parse_results(results)
+    yield "load_prompts", "calls/s", lambda: measure(lambda _: load_prompts())
+    yield "run_all_prompts test_mode", "runs/s", lambda: measure(lambda _: run_all_prompts(chunks, level=level, test_mode=True))
+    yield "parse_results", "runs/s", lambda: measure(lambda _: parse_results(results))
+    yield "build_markdown", "runs/s", lambda: measure(lambda _: build_markdown(materials))
+
+def compare(results, baseline, threshold):
+    """Cases whose best-sample latency or peak memory grew by more than ``threshold``.
+
+    The best sample is compared rather than the median because it is what
+    other load on the machine disturbs least (the advice in ``timeit``'s docs).
+    """
+    regressions = []  # (case name, description)
+    for name, current in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        for metric in ("min_ms", "peak_kb"):
+            if metric not in before:
+                continue
+            if before[metric] > 0 and current[metric] > before[metric] * (1 + threshold):
+                regressions.append((name, f"{name}: {metric} {before[metric]:.2f} -> {current[metric]:.2f} (+{current[metric] / before[metric] - 1:.0%})"))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the local hot paths on synthetic Spanish corpora (LLM calls use test mode).")
+    parser.add_argument("--sizes", nargs="+", default=list(SIZES), choices=list(SIZES), help="corpus sizes to run")
+    parser.add_argument("--filter", default="", help="only run cases whose name contains this")
+    parser.add_argument("--baseline", default=".cache/bench_baseline.json", help="baseline file to compare against")
+    parser.add_argument("--save", action="store_true", help="write these results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative slowdown or memory growth reported as a regression")
+    parser.add_argument("--confirm", type=int, default=2, help="times to re-measure a flagged case before reporting it")
+    args = parser.parse_args(argv)
+
+    # Measure the pipeline itself: no response cache and no micro-batching delay.
+    # The app modules are imported by the cases below, so this takes effect.
+    os.environ.setdefault("LLM_CACHE", "0")
+    os.environ.setdefault("EMBED_SERVICE", "0")
+
+    store_root = tempfile.TemporaryDirectory(prefix="bench-embeddings-")
+    cases = list(fixed_cases())
+    for label in args.sizes:
+        cases += list(corpus_cases(label, spanish_corpus(SIZES[label]), os.path.join(store_root.name, label)))
+
+    results = {}
+    print(f"{'case':34} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'throughput':>18} {'peak KB':>10}")
+    for name, unit, run in cases:
+        if args.filter not in name:
+            continue
+        try:
+            result = run()
+        except ImportError as e:
+            # The embedding model is an optional, heavy dependency
+            print(f"{name:34} skipped: {e}")
+            continue
+        results[name] = result
+        print(f"{name:34} {result['p50_ms']:10.2f} {result['p95_ms']:10.2f} {result['p99_ms']:10.2f} "
+              f"{result['throughput']:12.1f} {unit:>5} {result['peak_kb']:10.1f}")
+
+    baseline_path = Path(args.baseline)
+    if args.save:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(json.dumps(results, indent=2))
+        print(f"Saved baseline to {baseline_path}")
+    elif baseline_path.exists():
+        baseline = json.loads(baseline_path.read_text())
+        runs = {name: run for name, _, run in cases}
+        regressions = compare(results, baseline, args.threshold)
+        # A slowdown has to reproduce to count: re-measure flagged cases, keeping the best of each metric
+        for _ in range(args.confirm):
+            if not regressions:
+                break
+            for name in {name for name, _ in regressions}:
+                again = runs[name]()
+                for metric in ("min_ms", "peak_kb"):
+                    results[name][metric] = min(results[name][metric], again[metric])
+            regressions = compare(results, baseline, args.threshold)
+        for _, line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            store_root.cleanup()
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%} against {baseline_path}")
+    store_root.cleanup()
+
+if __name__ == "__main__":
+    main()
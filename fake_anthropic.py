@@ -0,0 +1,193 @@
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from llm import get_mock_data
+from utils.chunk import estimate_claude_tokens
+
+class FakeAnthropicServer(ThreadingHTTPServer):
+    """Local stand-in for the Anthropic Messages API, for load tests.
+
+    Answers ``POST /v1/messages``, both plain and ``"stream": true`` (SSE),
+    with ``llm.get_mock_data`` output so the app can parse it. Time to first
+    token is drawn from a lognormal distribution around ``latency_ms`` with
+    spread ``latency_sigma``. Output then arrives at ``tokens_per_second``.
+    A fraction of requests fail with 429 (``rate_limit_rate``) or 500/529
+    (``error_rate``). With ``max_concurrent`` set, requests beyond it get a
+    529 overloaded error. ``GET /stats`` returns the request counters.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), latency_ms=800, latency_sigma=0.5, tokens_per_second=80,
+                 rate_limit_rate=0.0, error_rate=0.0, retry_after=1.0, max_concurrent=0, seed=None):
+        super().__init__(address, _Handler)
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.tokens_per_second = tokens_per_second
+        self.rate_limit_rate = rate_limit_rate
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.max_concurrent = max_concurrent
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.active = 0
+        self.counters = {"requests": 0, "ok": 0, "rate_limited": 0, "errors": 0, "overloaded": 0,
+                         "peak_concurrency": 0, "input_tokens": 0, "output_tokens": 0}
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serve from a daemon thread; returns self."""
+        threading.Thread(target=self.serve_forever, name="fake-anthropic", daemon=True).start()
+        return self
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, active=self.active)
+
+    def _count(self, **increments):
+        with self._lock:
+            for name, n in increments.items():
+                self.counters[name] += n
+
+    def _first_token_delay(self):
+        with self._lock:
+            return self.random.lognormvariate(0, self.latency_sigma) * self.latency_ms / 1000
+
+    def _injected_error(self):
+        """(status, error type) to fail this request with, or None."""
+        with self._lock:
+            roll = self.random.random()
+            pick = self.random.choice((500, 529))
+        if roll < self.rate_limit_rate:
+            return 429, "rate_limit_error"
+        if roll < self.rate_limit_rate + self.error_rate:
+            return pick, "api_error" if pick == 500 else "overloaded_error"
+        return None
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            self._send_json(200, self.server.stats())
+        else:
+            self._send_json(404, {"type": "error", "error": {"type": "not_found_error", "message": self.path}})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path.split("?")[0].rstrip("/") != "/v1/messages":
+            self._send_json(404, {"type": "error", "error": {"type": "not_found_error", "message": self.path}})
+            return
+        server = self.server
+        with server._lock:
+            server.counters["requests"] += 1
+            overloaded = server.max_concurrent and server.active >= server.max_concurrent
+            if not overloaded:
+                server.active += 1
+                server.counters["peak_concurrency"] = max(server.counters["peak_concurrency"], server.active)
+        if overloaded:
+            server._count(overloaded=1)
+            self._send_error(529, "overloaded_error")
+            return
+        try:
+            self._answer(body)
+        finally:
+            with server._lock:
+                server.active -= 1
+
+    def _answer(self, body):
+        server = self.server
+        time.sleep(server._first_token_delay())
+        error = server._injected_error()
+        if error:
+            server._count(**{"rate_limited" if error[0] == 429 else "errors": 1})
+            self._send_error(*error)
+            return
+
+        prompt = "\n".join(m["content"] if isinstance(m["content"], str) else "".join(b.get("text", "") for b in m["content"])
+                           for m in body.get("messages", []))
+        text = get_mock_data(prompt)
+        input_tokens = estimate_claude_tokens(body.get("system", "")) + estimate_claude_tokens(prompt)
+        output_tokens = estimate_claude_tokens(text)
+        server._count(ok=1, input_tokens=input_tokens, output_tokens=output_tokens)
+        message = {
+            "id": f"msg_{uuid.uuid4().hex[:24]}",
+            "type": "message",
+            "role": "assistant",
+            "model": body.get("model", ""),
+            "stop_reason": None,
+            "stop_sequence": None,
+        }
+        if not body.get("stream"):
+            time.sleep(output_tokens / server.tokens_per_second)
+            self._send_json(200, dict(message, content=[{"type": "text", "text": text}], stop_reason="end_turn",
+                                      usage={"input_tokens": input_tokens, "output_tokens": output_tokens}))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self._event("message_start", {"type": "message_start", "message": dict(message, content=[], usage={"input_tokens": input_tokens, "output_tokens": 1})})
+        self._event("content_block_start", {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}})
+        # About four tokens per delta, paced at the configured token rate
+        step = 14
+        for i in range(0, len(text), step):
+            time.sleep(estimate_claude_tokens(text[i:i + step]) / server.tokens_per_second)
+            self._event("content_block_delta", {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": text[i:i + step]}})
+        self._event("content_block_stop", {"type": "content_block_stop", "index": 0})
+        self._event("message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None}, "usage": {"output_tokens": output_tokens}})
+        self._event("message_stop", {"type": "message_stop"})
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _event(self, name, data):
+        payload = f"event: {name}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+        self.wfile.write(f"{len(payload):x}\r\n".encode("ascii") + payload + b"\r\n")
+        self.wfile.flush()
+
+    def _send_error(self, status, error_type):
+        headers = {"retry-after": f"{self.server.retry_after:g}"} if status == 429 else {}
+        self._send_json(status, {"type": "error", "error": {"type": error_type, "message": f"Injected {error_type}"}}, headers)
+
+    def _send_json(self, status, data, headers=None):
+        payload = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a fake Anthropic Messages API for load tests.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=800, help="median time to first token")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="lognormal spread of the time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=80, help="output token rate")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 500 or 529")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="retry-after seconds sent with 429s")
+    parser.add_argument("--max-concurrent", type=int, default=0, help="answer 529 beyond this many requests in flight (0 = unlimited)")
+    args = parser.parse_args(argv)
+
+    server = FakeAnthropicServer((args.host, args.port), args.latency_ms, args.latency_sigma, args.tokens_per_second,
+                                 args.rate_limit_rate, args.error_rate, args.retry_after, args.max_concurrent)
+    print(f"Fake Anthropic API on {server.base_url}; set ANTHROPIC_BASE_URL={server.base_url}")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -1,38 +1,90 @@
 import os
 import json
-from anthropic import Anthropic
+import re
+import time
+from functools import lru_cache
 from dotenv import load_dotenv
-import streamlit as st
+from utils.cache import ResponseCache
+from utils.chunk import estimate_claude_tokens
+from utils.resilience import DeadlineExceeded, RetryPolicy, SingleFlight, TokenBucket
+from utils.tracing import span, tracer
 
 load_dotenv()
 
-# Try st.secrets first (for Streamlit Cloud), fall back to env var (for local)
+# Try st.secrets first (for Streamlit Cloud), fall back to env var (for local and headless runs)
 try:
+    import streamlit as st
     api_key = st.secrets["ANTHROPIC_API_KEY"]
-except (KeyError, FileNotFoundError):
+except (ImportError, KeyError, FileNotFoundError):
     api_key = os.getenv("ANTHROPIC_API_KEY")
 
-client = Anthropic(api_key=api_key)
+@lru_cache(maxsize=None)
+def get_client():
+    # The anthropic SDK is slow to import, so it's deferred until the first real call
+    from anthropic import Anthropic
+    # Retries are handled by retry_policy below, so the SDK's own are turned off.
+    # ANTHROPIC_BASE_URL points the client at another server, e.g. a local fake for load tests.
+    return Anthropic(
+        api_key=api_key,
+        base_url=os.getenv("ANTHROPIC_BASE_URL") or None,
+        timeout=float(os.getenv("LLM_TIMEOUT", "120")),
+        max_retries=0,
+    )
+
+SYSTEM_PROMPT = "You are a patient and precise Spanish teacher. Help students understand Spanish language, grammar, vocabulary, and culture clearly and thoroughly."
+MAX_TOKENS = 4096
+TEMPERATURE = 0.2
+# Shared with rag.build_combined_prompt so the mock can recognise combined requests
+COMBINED_MARKER = "Complete every task below. Each task describes the JSON it returns."
+# Shared with rag's batch grading prompts for the same reason
+BATCH_GRADING_MARKER = "Grade each numbered item below separately."
+
+# Response cache shared by every session in this process and persisted across restarts.
+# Set LLM_CACHE=0 to turn it off entirely.
+response_cache = None
+if os.getenv("LLM_CACHE", "1") != "0":
+    response_cache = ResponseCache(
+        os.getenv("LLM_CACHE_PATH", ".cache/llm_responses.sqlite3"),
+        max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000")),
+        max_bytes=int(os.getenv("LLM_CACHE_MAX_BYTES", str(200 * 1024 * 1024))),
+        ttl=float(os.getenv("LLM_CACHE_TTL", str(30 * 24 * 3600))),
+    )
+
+# Client-side limits shared by every session in this process. 0 disables a limiter.
+retry_policy = RetryPolicy(
+    max_retries=int(os.getenv("LLM_MAX_RETRIES", "5")),
+    base_delay=float(os.getenv("LLM_RETRY_BASE_DELAY", "1.0")),
+    max_delay=float(os.getenv("LLM_RETRY_MAX_DELAY", "60")),
+)
+request_limiter = TokenBucket(int(os.getenv("LLM_REQUESTS_PER_MINUTE", "50")))
+token_limiter = TokenBucket(int(os.getenv("LLM_INPUT_TOKENS_PER_MINUTE", "50000")))
+# Identical prompts requested concurrently share one upstream call
+inflight = SingleFlight()
 
 def get_mock_data(prompt):
     """Return mock data for testing without calling the LLM."""
+    if COMBINED_MARKER in prompt:
+        # Combined request: answer each "### name" task section as if it had been asked on its own
+        body = prompt.split(COMBINED_MARKER, 1)[1].rsplit("\n\nReturn a single JSON object", 1)[0]
+        tasks = body.split("\n### ")[1:]
+        combined = {}
+        for task in tasks:
+            name, _, instructions = task.partition("\n")
+            combined[name.strip()] = json.loads(get_mock_data(instructions))
+        return json.dumps(combined)
+    if BATCH_GRADING_MARKER in prompt:
+        # Batch grading: one canned feedback per "Item N" block
+        items = re.findall(r"^Item (\d+)$", prompt, re.M)
+        kind = "Student's sentence" if "Student's sentence" in prompt else "Student's answer"
+        single = get_mock_data(f"comprehension Spanish teacher {kind}")
+        return json.dumps({"feedback": [{"item": int(n), "feedback": single} for n in items]})
     if "comprehension" in prompt.lower() and "Student's answer" in prompt:
         # Feedback for comprehension questions
         return "Good effort! Your answer captures the main idea correctly. Your Spanish grammar is solid, though you could use 'es sobre' instead of 'trata de' for a more natural expression. Keep practicing - your comprehension skills are improving!"
     elif "Spanish teacher" in prompt and "Student's sentence" in prompt:
         # Feedback for practice sentences
         return "Great job using the word! Your sentence is grammatically correct. A more natural way to say this might be: 'Me gusta correr cada mañana en el parque.' Keep up the good work - you're using the verb correctly!"
-    elif "vocabulary" in prompt.lower() or "vocab" in prompt.lower():
-        return json.dumps({
-            "vocabulary": [
-                {"spanish": "casa", "english": "house", "pos": "noun", "example": "Mi casa es grande."},
-                {"spanish": "correr", "english": "to run", "pos": "verb", "example": "Me gusta correr por la mañana."},
-                {"spanish": "rápido", "english": "fast", "pos": "adjective", "example": "El coche es muy rápido."},
-                {"spanish": "caminar", "english": "to walk", "pos": "verb", "example": "Prefiero caminar al trabajo."},
-                {"spanish": "comida", "english": "food", "pos": "noun", "example": "La comida española es deliciosa."},
-            ]
-        })
-    elif "dialogue" in prompt.lower():
+    elif "dialogue" in prompt.lower() or "conversation" in prompt.lower():
         return json.dumps({
             "title": "En el Mercado",
             "lines": [
@@ -46,6 +98,16 @@ def get_mock_data(prompt):
                 {"spanish": "el kilo", "english": "the kilogram"},
             ]
         })
+    elif "vocabulary" in prompt.lower() or "vocab" in prompt.lower():
+        return json.dumps({
+            "vocabulary": [
+                {"spanish": "casa", "english": "house", "pos": "noun", "example": "Mi casa es grande."},
+                {"spanish": "correr", "english": "to run", "pos": "verb", "example": "Me gusta correr por la mañana."},
+                {"spanish": "rápido", "english": "fast", "pos": "adjective", "example": "El coche es muy rápido."},
+                {"spanish": "caminar", "english": "to walk", "pos": "verb", "example": "Prefiero caminar al trabajo."},
+                {"spanish": "comida", "english": "food", "pos": "noun", "example": "La comida española es deliciosa."},
+            ]
+        })
     elif "question" in prompt.lower():
         return json.dumps({
             "questions": [
@@ -57,19 +119,139 @@ def get_mock_data(prompt):
     else:
         return json.dumps({"message": "Mock data for testing"})
 
-def call_llm(prompt, model=os.getenv("MODEL_NAME", "claude-3-5-haiku-20241022"), test_mode=False):
-    """Call Claude with a prompt. The LLM acts as a patient and precise Spanish teacher."""
-    if test_mode:
-        return get_mock_data(prompt)
-
-    system = "You are a patient and precise Spanish teacher. Help students understand Spanish language, grammar, vocabulary, and culture clearly and thoroughly."
+def _cache_key(prompt, model, test_mode):
+    return ResponseCache.make_key(
+        model=model,
+        system=SYSTEM_PROMPT,
+        prompt=prompt,
+        temperature=TEMPERATURE,
+        max_tokens=MAX_TOKENS,
+        test_mode=test_mode,
+    )
 
-    response = client.messages.create(
+def _request_kwargs(prompt, model, timeout):
+    return dict(
         model=model,
-        max_tokens=4096,
-        system=system,
+        max_tokens=MAX_TOKENS,
+        system=SYSTEM_PROMPT,
         messages=[{"role": "user", "content": prompt}],
-        temperature=0.2
+        temperature=TEMPERATURE,
+        **({"timeout": timeout} if timeout is not None else {})
     )
-    return response.content[0].text
 
+def _deadline(timeout):
+    return time.monotonic() + timeout if timeout is not None else None
+
+def _remaining(deadline, timeout):
+    """Request timeout for the next attempt: whatever is left before the deadline."""
+    if deadline is None:
+        return timeout
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise DeadlineExceeded("prompt timeout reached")
+    return left
+
+def _throttle(prompt, deadline=None):
+    """Wait for request and token budget; returns the tokens charged."""
+    estimate = estimate_claude_tokens(SYSTEM_PROMPT) + estimate_claude_tokens(prompt)
+    request_limiter.acquire(1, deadline)
+    token_limiter.acquire(estimate, deadline)
+    return estimate
+
+def _record_usage(usage, estimate, trace_span):
+    """Settle the token budget against real usage and note it on the trace span."""
+    if usage is None:
+        return
+    token_limiter.adjust(usage.input_tokens - estimate)
+    trace_span.set(input_tokens=usage.input_tokens, output_tokens=usage.output_tokens)
+
+def _create(prompt, model, timeout):
+    """One messages.create call with rate limiting and retries, all within ``timeout``."""
+    deadline = _deadline(timeout)
+    attempts = []
+    def attempt():
+        attempts.append(1)
+        tracer.current().set(attempts=len(attempts))
+        estimate = _throttle(prompt, deadline)
+        response = get_client().messages.create(**_request_kwargs(prompt, model, _remaining(deadline, timeout)))
+        _record_usage(getattr(response, "usage", None), estimate, tracer.current())
+        return response.content[0].text
+    return retry_policy.call(attempt, deadline=deadline)
+
+def call_llm(prompt, model=os.getenv("MODEL_NAME", "claude-3-5-haiku-20241022"), test_mode=False, timeout=None, use_cache=True):
+    """Call Claude with a prompt. The LLM acts as a patient and precise Spanish teacher.
+
+    ``timeout`` (seconds) bounds the whole call, including rate-limit waits,
+    retries and backoff; without it each attempt uses the client's default.
+    Responses are served from the shared response cache when possible; pass
+    ``use_cache=False`` to always go to the model. Test mode goes through the
+    same cache, under its own keys. Concurrent identical calls are coalesced
+    into one request, which is rate limited and retried on transient errors.
+    """
+    with span("llm.call", model=model, test_mode=test_mode) as s:
+        key = _cache_key(prompt, model, test_mode)
+        cache = response_cache if use_cache else None
+        if cache is not None:
+            cached = cache.get(key)
+            if cached is not None:
+                s.set(cache_hit=True)
+                return cached
+
+        def generate():
+            text = get_mock_data(prompt) if test_mode else _create(prompt, model, timeout)
+            if cache is not None:
+                cache.set(key, text)
+            return text
+
+        # The leader enforces its own timeout; followers stop waiting at theirs
+        return inflight.do((key, use_cache), generate, deadline=_deadline(timeout))
+
+def stream_llm(prompt, model=os.getenv("MODEL_NAME", "claude-3-5-haiku-20241022"), test_mode=False, timeout=None, use_cache=True):
+    """Streaming variant of call_llm that yields text deltas as they arrive.
+
+    A cache hit is yielded as a single delta. The full text is written to the
+    cache once the stream completes. Opening the stream is rate limited and
+    retried like call_llm, within ``timeout``; once text has started flowing,
+    errors propagate.
+    """
+    with span("llm.stream", model=model, test_mode=test_mode) as s:
+        key = None
+        if use_cache and response_cache is not None:
+            key = _cache_key(prompt, model, test_mode)
+            cached = response_cache.get(key)
+            if cached is not None:
+                s.set(cache_hit=True)
+                yield cached
+                return
+
+        parts = []
+        if test_mode:
+            mock = get_mock_data(prompt)
+            for i in range(0, len(mock), 64):
+                parts.append(mock[i:i + 64])
+                yield parts[-1]
+        else:
+            deadline = _deadline(timeout)
+            attempts = []
+            def open_stream():
+                attempts.append(1)
+                s.set(attempts=len(attempts))
+                estimate = _throttle(prompt, deadline)
+                manager = get_client().messages.stream(**_request_kwargs(prompt, model, _remaining(deadline, timeout)))
+                # Entering the manager sends the request, so connection and status errors surface here
+                return manager, manager.__enter__(), estimate
+
+            started = time.perf_counter()
+            manager, stream, estimate = retry_policy.call(open_stream, deadline=deadline)
+            try:
+                for delta in stream.text_stream:
+                    if not parts:
+                        s.set(first_token_ms=round((time.perf_counter() - started) * 1000, 3))
+                    parts.append(delta)
+                    yield delta
+                _record_usage(getattr(stream.get_final_message(), "usage", None), estimate, s)
+            finally:
+                manager.__exit__(None, None, None)
+
+        if key is not None:
+            response_cache.set(key, "".join(parts))
@@ -0,0 +1,277 @@
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from bench import percentile, spanish_corpus
+
+STAGES = ["app_load", "scrape", "chunk", "build_index", "retrieve", "generate", "first_item", "parse", "flip_card", "next_card",
+          "sentence_feedback", "grade_answers", "session"]
+APP = Path(__file__).with_name("app.py")
+
+class Recorder:
+    """Thread-safe latency samples and error counts per stage."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.samples[stage].append(seconds)
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+class _Stage:
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.recorder.add(self.name, time.perf_counter() - self.start)
+        else:
+            with self.recorder._lock:
+                self.recorder.errors[self.name] += 1
+        return False
+
+def think(seconds):
+    if seconds:
+        time.sleep(random.uniform(0.5, 1.5) * seconds)
+
+def user_session(seed, recorder, args):
+    """One user's trip through the app: generate materials, flip cards, ask for feedback."""
+    from models import parse_results
+    from rag import (add_to_library, build_index, choose_top_k, get_sentence_feedback, grade_comprehension_answers,
+                     load_queries, repair_output, retrieve_multi, run_all_prompts, stream_all_prompts)
+    from utils.chunk import chunk_text
+    from utils.embed_store import document_key
+    from utils.render import build_markdown
+    from utils.scrape import get_text
+
+    started = time.perf_counter()
+    with recorder.stage("scrape"):
+        scraped = get_text(spanish_corpus(args.article_bytes, seed=seed))
+    with recorder.stage("chunk"):
+        chunks = chunk_text(scraped)
+    with recorder.stage("build_index"):
+        index, vecs = build_index(chunks)
+        add_to_library(f"text:{document_key([c['text'] for c in chunks])[:12]}", chunks, vecs)
+    with recorder.stage("retrieve"):
+        hits = retrieve_multi(chunks, index, load_queries(), k=choose_top_k(len(chunks)), vecs=vecs)
+
+    with recorder.stage("generate"):
+        if args.stream:
+            results, generate_started, first_seen = {}, time.perf_counter(), False
+            for kind, name, value in stream_all_prompts(hits, level=args.level, source_text=scraped, mode=args.mode):
+                if not first_seen:
+                    first_seen = True
+                    recorder.add("first_item", time.perf_counter() - generate_started)
+                if kind != "item":
+                    results[name] = value
+        else:
+            results = run_all_prompts(hits, level=args.level, source_text=scraped, mode=args.mode)
+    with recorder.stage("parse"):
+        materials = parse_results(results, reask=lambda name, output, error: repair_output(name, output, error))
+        build_markdown(materials)
+
+    # Without Streamlit in the loop flipping a card is only a session-state change, so it is
+    # think time here; the app driver times the reruns it triggers
+    vocab = materials.vocab.vocabulary if materials.vocab else []
+    for _ in vocab[:args.cards]:
+        think(args.think_time)
+    if vocab:
+        word = vocab[0].spanish
+        think(args.think_time)
+        with recorder.stage("sentence_feedback"):
+            get_sentence_feedback(f"Yo uso la palabra {word} todos los días.", word, args.level)
+    questions = materials.questions.one_per_difficulty() if materials.questions else []
+    if questions:
+        think(args.think_time)
+        with recorder.stage("grade_answers"):
+            grade_comprehension_answers([(q.question, q.answer, q.answer) for q in questions], args.level)
+    recorder.add("session", time.perf_counter() - started)
+
+def app_session(seed, recorder, args):
+    """One user's trip through the real app.py, driven with Streamlit's AppTest.
+
+    Every click goes through the app's own rerun (whole script or fragment),
+    so the stages time what a browser would wait for after each action.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    def find(elements, label, key=None):
+        return next(e for e in elements if e.label.startswith(label) and e.key == key)
+
+    def act(stage, widget):
+        with recorder.stage(stage):
+            widget.run()
+            if at.exception:
+                raise RuntimeError(f"{stage}: {at.exception[0].value}")
+
+    started = time.perf_counter()
+    at = AppTest.from_file(str(APP), default_timeout=args.app_timeout)
+    with recorder.stage("app_load"):
+        at.run()
+    find(at.selectbox, "Your Spanish Level").set_value(args.level)
+    find(at.checkbox, "⚡ Show materials").set_value(args.stream)
+    find(at.checkbox, "📦 Generate all materials").set_value(args.mode == "combined")
+    find(at.text_area, "Or paste text").input(spanish_corpus(args.article_bytes, seed=seed))
+    act("generate", find(at.button, "Generate Study Materials").click())
+
+    for _ in range(args.cards):
+        think(args.think_time)
+        act("flip_card", find(at.button, "🔄 Flip Card").click())
+        next_card = find(at.button, "Next ▶")
+        if next_card.disabled:
+            break
+        think(args.think_time)
+        act("next_card", next_card.click())
+
+    practice = [e for e in at.text_area if e.label.startswith("Try using")]
+    if practice:
+        think(args.think_time)
+        word = practice[0].label.split("**")[1]
+        practice[0].input(f"Yo uso la palabra {word} todos los días.")
+        act("sentence_feedback", find(at.button, "Get Feedback").click())
+    answers = [e for e in at.text_area if e.key and e.key.startswith("comp_answer_")]
+    if answers:
+        think(args.think_time)
+        for answer in answers:
+            answer.input("Creo que el texto habla de la vida diaria.")
+        act("grade_answers", find(at.button, "📝 Grade All Answers").click())
+    recorder.add("session", time.perf_counter() - started)
+
+def run_level(users, args):
+    """Run ``users`` concurrent users; returns (recorder, wall seconds, sessions, failed sessions)."""
+    recorder = Recorder()
+    failures = []
+    deadline = time.perf_counter() + args.duration if args.duration else None
+
+    session = app_session if args.driver == "app" else user_session
+
+    def user(n):
+        i = 0
+        while (deadline and time.perf_counter() < deadline) or (not deadline and i < args.iterations):
+            try:
+                session(users * 100_000 + n * 1000 + i, recorder, args)
+            except Exception as e:
+                failures.append(repr(e))
+            i += 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=user, args=(n,), daemon=True) for n in range(users)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return recorder, time.perf_counter() - started, len(recorder.samples["session"]), failures
+
+def saturation_point(levels, min_efficiency):
+    """First user count at which throughput grew less than ``min_efficiency`` times as fast as users did."""
+    for (prev_users, prev_tput), (users, tput) in zip(levels, levels[1:]):
+        if prev_tput and (tput / prev_tput) / (users / prev_users) < min_efficiency:
+            return users
+    return None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the app with simulated users against a fake (or real) Anthropic API.")
+    parser.add_argument("--driver", default="pipeline", choices=["pipeline", "app"],
+                        help="pipeline calls the rag functions a session uses directly and treats card flips as think time; "
+                             "app drives app.py through streamlit.testing's AppTest, so every click pays for the app's "
+                             "own rerun and Streamlit's overhead counts towards saturation")
+    parser.add_argument("--app-timeout", type=float, default=300, help="seconds one app rerun may take (app driver)")
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 2, 4, 8, 16], help="concurrency levels to ramp through")
+    parser.add_argument("--iterations", type=int, default=2, help="sessions per user at each level")
+    parser.add_argument("--duration", type=float, default=0, help="seconds per level instead of a fixed number of sessions")
+    parser.add_argument("--article-bytes", type=int, default=8000)
+    parser.add_argument("--level", default="B1")
+    parser.add_argument("--mode", default="separate", choices=["separate", "combined"])
+    parser.add_argument("--stream", action="store_true", help="generate with stream_all_prompts like the app's streaming option")
+    parser.add_argument("--cards", type=int, default=5, help="flashcards each user flips")
+    parser.add_argument("--think-time", type=float, default=0.0, help="mean seconds a user pauses between actions")
+    parser.add_argument("--cache", action="store_true", help="keep the LLM response cache on")
+    parser.add_argument("--no-client-limits", action="store_true", help="turn off the client-side request and token rate limits")
+    parser.add_argument("--min-efficiency", type=float, default=0.5, help="scaling efficiency below which a level counts as saturated")
+    parser.add_argument("--base-url", help="use this API server instead of starting the fake one")
+    server_options = parser.add_argument_group("fake server")
+    server_options.add_argument("--latency-ms", type=float, default=800)
+    server_options.add_argument("--latency-sigma", type=float, default=0.5)
+    server_options.add_argument("--tokens-per-second", type=float, default=80)
+    server_options.add_argument("--rate-limit-rate", type=float, default=0.0)
+    server_options.add_argument("--error-rate", type=float, default=0.0)
+    server_options.add_argument("--max-concurrent", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    # llm and rag read these at import time, so they are set before anything imports them
+    workdir = tempfile.TemporaryDirectory(prefix="loadtest-")
+    os.environ.setdefault("ANTHROPIC_API_KEY", "fake-key")
+    os.environ.setdefault("EMBED_STORE_DIR", os.path.join(workdir.name, "embeddings"))
+    os.environ.setdefault("LIBRARY_DIR", os.path.join(workdir.name, "library"))
+    if not args.cache:
+        os.environ["LLM_CACHE"] = "0"
+    if args.no_client_limits:
+        os.environ["LLM_REQUESTS_PER_MINUTE"] = "0"
+        os.environ["LLM_INPUT_TOKENS_PER_MINUTE"] = "0"
+
+    server = None
+    if args.base_url:
+        os.environ["ANTHROPIC_BASE_URL"] = args.base_url
+    else:
+        from fake_anthropic import FakeAnthropicServer
+        server = FakeAnthropicServer(latency_ms=args.latency_ms, latency_sigma=args.latency_sigma,
+                                     tokens_per_second=args.tokens_per_second, rate_limit_rate=args.rate_limit_rate,
+                                     error_rate=args.error_rate, max_concurrent=args.max_concurrent).start()
+        os.environ["ANTHROPIC_BASE_URL"] = server.base_url
+
+    import llm
+    print(f"API {os.environ['ANTHROPIC_BASE_URL']}  •  client limits: {os.getenv('LLM_REQUESTS_PER_MINUTE', '50')} req/min, "
+          f"{os.getenv('LLM_INPUT_TOKENS_PER_MINUTE', '50000')} input tokens/min  •  cache {'on' if llm.response_cache else 'off'}")
+
+    # Load the embedding model and open the stores before anything is timed
+    warm_up = app_session if args.driver == "app" else user_session
+    warm_up(0, Recorder(), argparse.Namespace(**{**vars(args), "think_time": 0}))
+
+    levels = []
+    for users in args.users:
+        before = server.stats() if server else {}
+        recorder, wall, sessions, failures = run_level(users, args)
+        throughput = sessions / wall * 60
+        levels.append((users, throughput))
+
+        print(f"\n{users} users: {sessions} sessions in {wall:.1f}s  •  {throughput:.1f} sessions/min  •  {len(failures)} failed")
+        if server:
+            after = server.stats()
+            print("  server: " + ", ".join(f"{k} {after[k] - before.get(k, 0)}" for k in ("requests", "rate_limited", "errors", "overloaded"))
+                  + f", peak concurrency {after['peak_concurrency']}")
+        print(f"  {'stage':18} {'n':>5} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'errors':>7}")
+        for stage in STAGES:
+            samples = recorder.samples.get(stage)
+            if samples or recorder.errors.get(stage):
+                p = [percentile(samples, q) * 1000 if samples else float("nan") for q in (50, 95, 99)]
+                print(f"  {stage:18} {len(samples or []):5} {p[0]:10.1f} {p[1]:10.1f} {p[2]:10.1f} {recorder.errors.get(stage, 0):7}")
+        for failure in sorted(set(failures))[:3]:
+            print(f"  failure: {failure}")
+
+    print("\nusers  sessions/min")
+    for users, throughput in levels:
+        print(f"{users:5}  {throughput:12.1f}")
+    point = saturation_point(levels, args.min_efficiency)
+    if point:
+        print(f"Saturation begins at {point} users: throughput scaled below {args.min_efficiency:.0%} of the user increase")
+    else:
+        print("No saturation within the tested concurrency levels")
+    workdir.cleanup()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import json
+import re
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel, ValidationError
+
+class VocabItem(BaseModel):
+    spanish: str = ""
+    english: str = ""
+    pos: str = ""
+    example: str = ""
+
+class Vocab(BaseModel):
+    vocabulary: List[VocabItem] = []
+
+class Question(BaseModel):
+    question: str = ""
+    answer: str = ""
+    difficulty: str = "intermediate"
+
+class Questions(BaseModel):
+    questions: List[Question] = []
+
+    def one_per_difficulty(self, difficulties=("beginner", "intermediate", "advanced")):
+        """The first question of each difficulty, in difficulty order."""
+        selected = []
+        for diff in difficulties:
+            for q in self.questions:
+                if q.difficulty.lower() == diff:
+                    selected.append(q)
+                    break
+        return selected
+
+class DialogueLine(BaseModel):
+    speaker: str = ""
+    es: str = ""
+
+class GlossaryEntry(BaseModel):
+    spanish: str = ""
+    english: str = ""
+
+class Dialogue(BaseModel):
+    title: str = ""
+    lines: List[DialogueLine] = []
+    glossary: List[GlossaryEntry] = []
+
+class StudyPlanDetails(BaseModel):
+    vocabulary: List[str] = []
+    grammar: List[str] = []
+    activities: List[str] = []
+    timeline: str = ""
+
+class StudyPlan(BaseModel):
+    plan: StudyPlanDetails
+
+# Prompt name -> model for its JSON payload
+PAYLOAD_MODELS = {
+    "vocab": Vocab,
+    "questions": Questions,
+    "dialogue": Dialogue,
+    "studyplan": StudyPlan,
+}
+
+class GenerationFailed(str):
+    """Output placeholder for a prompt whose request failed (the message is the error).
+
+    parse_results reports these as errors and never sends them to ``reask``,
+    which only sees replies that arrived but didn't parse.
+    """
+
+class StudyMaterials(BaseModel):
+    """Generated materials, parsed and validated once when generation finishes.
+
+    ``raw`` keeps every prompt's original output in prompt order; ``errors``
+    holds the reason for any payload that could not be parsed, whose field
+    is then left as None.
+    """
+
+    vocab: Optional[Vocab] = None
+    questions: Optional[Questions] = None
+    dialogue: Optional[Dialogue] = None
+    studyplan: Optional[StudyPlan] = None
+    raw: Dict[str, str] = {}
+    errors: Dict[str, str] = {}
+
+    def payload(self, name):
+        return getattr(self, name) if name in PAYLOAD_MODELS else None
+
+_FENCE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$")
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+
+def extract_json(text):
+    """Parse the JSON object in a model reply, tolerating common defects.
+
+    Handles markdown code fences, prose before or after the object and
+    trailing commas. Raises ValueError if no JSON object can be recovered.
+    """
+    candidate = _FENCE.sub("", text.strip())
+    start, end = candidate.find("{"), candidate.rfind("}")
+    if start == -1 or end < start:
+        raise ValueError("no JSON object found")
+    candidate = candidate[start:end + 1]
+    for attempt in (candidate, _TRAILING_COMMA.sub(r"\1", candidate)):
+        try:
+            return json.loads(attempt)
+        except json.JSONDecodeError as e:
+            error = e
+    raise ValueError(f"invalid JSON: {error}")
+
+def parse_payload(name, text):
+    """Validate one prompt's output against its model. Raises ValueError on failure."""
+    try:
+        return PAYLOAD_MODELS[name].model_validate(extract_json(text))
+    except ValidationError as e:
+        raise ValueError(str(e)) from e
+
+def parse_results(results, reask=None):
+    """Parse a ``{name: output}`` results dict into StudyMaterials.
+
+    ``reask(name, output, error)`` is called at most once for each payload that
+    fails to parse and may return a corrected output to try instead. Outputs
+    that are GenerationFailed go straight to ``errors``.
+    """
+    materials = StudyMaterials(raw=dict(results))
+    for name, output in results.items():
+        if isinstance(output, GenerationFailed):
+            materials.errors[name] = str(output)
+            continue
+        if name not in PAYLOAD_MODELS:
+            continue
+        try:
+            setattr(materials, name, parse_payload(name, output))
+            continue
+        except ValueError as e:
+            error = str(e)
+        if reask is not None:
+            try:
+                fixed = reask(name, output, error)
+                setattr(materials, name, parse_payload(name, fixed))
+                materials.raw[name] = fixed
+                continue
+            except Exception as e:
+                error = str(e)
+        materials.errors[name] = error
+    return materials
@@ -1,30 +1,192 @@
-from sentence_transformers import SentenceTransformer
-import faiss, numpy as np
-import streamlit as st
+import json
+import logging
 import os
+import re
+from functools import lru_cache
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from llm import call_llm
+from models import GenerationFailed, extract_json
+from llm import BATCH_GRADING_MARKER, COMBINED_MARKER, SYSTEM_PROMPT, call_llm, retry_policy, stream_llm
+from utils.embed_service import EmbeddingService
+from utils.embed_store import EmbeddingStore, document_key
+from utils.chunk import estimate_claude_tokens
+from utils.context import assemble_context
+from utils.jsonstream import JsonItemStream
+from utils.library import ArticleLibrary
+from utils.resilience import DeadlineExceeded
+from utils.timing import timed
+from utils.tracing import propagate, span
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on simultaneous Claude requests made by run_all_prompts
+MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+# Per-prompt request timeout in seconds
+PROMPT_TIMEOUT = float(os.getenv("LLM_PROMPT_TIMEOUT", "120"))
+# Overall bound, retries included, on feedback a student is waiting for after a click
+FEEDBACK_TIMEOUT = float(os.getenv("LLM_FEEDBACK_TIMEOUT", "30"))
+# Input-token budget for the retrieved context sent with each prompt
+MAX_CONTEXT_TOKENS = int(os.getenv("MAX_CONTEXT_TOKENS", "6000"))
+# "separate" sends one request per template; "combined" sends the context once for all of them
+GENERATION_MODE = os.getenv("GENERATION_MODE", "separate")
+# Relevance/diversity trade-off for MMR reranking of retrieved chunks; empty disables it
+_mmr_lambda = os.getenv("RETRIEVAL_MMR_LAMBDA", "0.7")
+MMR_LAMBDA = float(_mmr_lambda) if _mmr_lambda else None
+
+EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+# One of utils.embedders.BACKENDS: torch, torch-int8, onnx, onnx-int8
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch")
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_THREADS = int(os.getenv("EMBED_THREADS", "0")) or None
+# Micro-batch encode calls from concurrent sessions; EMBED_SERVICE=0 calls the backend directly
+EMBED_SERVICE = os.getenv("EMBED_SERVICE", "1") != "0"
+EMBED_SERVICE_MAX_BATCH = int(os.getenv("EMBED_SERVICE_MAX_BATCH", "64"))
+EMBED_SERVICE_MAX_WAIT_MS = float(os.getenv("EMBED_SERVICE_MAX_WAIT_MS", "5"))
+
+_model_lock = threading.Lock()
+# Separate from _model_lock, which is held for the whole model load, so warm_up never waits on it
+_warm_up_lock = threading.Lock()
+_warm_up_started = False
+
+@lru_cache(maxsize=None)
+def _load_model():
+    # The backends pull in torch or onnxruntime, so they are only imported when first needed
+    with timed("load embedding model"):
+        from utils.embedders import make_backend
+        backend = make_backend(EMBED_BACKEND, EMBED_MODEL, batch_size=EMBED_BATCH_SIZE, threads=EMBED_THREADS)
+    if not EMBED_SERVICE:
+        return backend
+    return EmbeddingService(backend, max_batch=EMBED_SERVICE_MAX_BATCH, max_wait_ms=EMBED_SERVICE_MAX_WAIT_MS)
 
-@st.cache_resource
 def get_model():
-    return SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+    """The shared embedding model (an EmbeddingService unless EMBED_SERVICE=0)."""
+    # The lock makes a request that arrives mid warm-up wait for it instead of loading a second copy
+    with _model_lock:
+        return _load_model()
+
+def embedding_stats():
+    """Micro-batching metrics, or None when the service is off or not started yet."""
+    model = _load_model() if _load_model.cache_info().currsize else None
+    return model.stats() if isinstance(model, EmbeddingService) else None
+
+def warm_up():
+    """Load and exercise the embedding model and faiss in a background thread.
+
+    Safe to call on every script run; only the first call starts the thread.
+    """
+    global _warm_up_started
+    with _warm_up_lock:
+        if _warm_up_started:
+            return
+        _warm_up_started = True
+
+    def run():
+        with timed("model warm-up"):
+            import faiss  # noqa: F401
+            get_model().encode(["Hola, mundo."], normalize_embeddings=True)
+
+    threading.Thread(target=run, name="model-warm-up", daemon=True).start()
+
+@lru_cache(maxsize=None)
+def get_embedding_store():
+    # Backends produce slightly different vectors, so each gets its own store
+    name = EMBED_MODEL if EMBED_BACKEND == "torch" else f"{EMBED_MODEL}:{EMBED_BACKEND}"
+    return EmbeddingStore(os.getenv("EMBED_STORE_DIR", ".cache/embeddings"), name)
 
-@st.cache_data
 def embed_chunks(chunks):
-    model = get_model()
-    return model.encode([c["text"] for c in chunks], normalize_embeddings=True)
+    """Embed chunk texts, reusing any vectors already in the embedding store."""
+    return get_embedding_store().get_or_compute(
+        [c["text"] for c in chunks],
+        lambda texts: get_model().encode(texts, normalize_embeddings=True),
+    )
 
 def build_index(chunks):
+    """Build (or reopen a snapshot of) the FAISS index for a document's chunks."""
+    store = get_embedding_store()
     vecs = embed_chunks(chunks)
-    index = faiss.IndexFlatIP(vecs.shape[1])
-    index.add(np.array(vecs).astype("float32"))
+    doc_key = document_key([c["text"] for c in chunks])
+    index = store.load_index(doc_key)
+    if index is None:
+        import faiss
+        index = faiss.IndexFlatIP(vecs.shape[1])
+        index.add(vecs)
+        store.save_index(doc_key, index)
     return index, vecs
 
+def choose_top_k(total_chunks):
+    """Number of chunks to retrieve: 60% of the document, at least 3 and at most 8."""
+    return min(max(int(total_chunks * 0.6), 3), 8)
+
 def retrieve(chunks, index, query, k=5):
     model = get_model()
     qv = model.encode([query], normalize_embeddings=True).astype("float32")
+    return search_index(chunks, index, qv, k)
+
+def retrieve_multi(chunks, index, queries, k=5, vecs=None, mmr_lambda=MMR_LAMBDA):
+    """Retrieve top-k chunks for several named queries at once.
+
+    All queries are encoded in one batch and searched with a single
+    ``index.search`` over the query matrix. Returns ``{name: scored chunks}``.
+    See search_multi for the MMR options.
+    """
+    names = list(queries)
+    qv = get_model().encode([queries[n] for n in names], normalize_embeddings=True).astype("float32")
+    return search_multi(chunks, index, qv, names, k, vecs, mmr_lambda)
+
+def search_multi(chunks, index, qv, names, k=5, vecs=None, mmr_lambda=MMR_LAMBDA):
+    """Search a matrix of encoded queries (one row per name) in one call.
+
+    With ``mmr_lambda`` (0-1) and the chunk ``vecs``, each query's hits are
+    reranked by maximal marginal relevance over a 3k candidate pool, trading
+    similarity to the query against redundancy with hits already chosen.
+    """
+    use_mmr = mmr_lambda is not None and vecs is not None
+    D, I = index.search(qv, k * 3 if use_mmr else k)
+    results = {}
+    for name, row_d, row_i in zip(names, D, I):
+        candidates = [(float(d), int(i)) for d, i in zip(row_d, row_i) if i >= 0]
+        if use_mmr:
+            candidates = _mmr(candidates, vecs, k, mmr_lambda)
+        results[name] = [dict(chunks[i], score=d) for d, i in candidates[:k]]
+    return results
+
+def _mmr(candidates, vecs, k, mmr_lambda):
+    selected = []
+    remaining = list(candidates)
+    while remaining and len(selected) < k:
+        def mmr_score(candidate):
+            score, i = candidate
+            redundancy = max((float(vecs[i] @ vecs[j]) for _, j in selected), default=0.0)
+            return mmr_lambda * score - (1 - mmr_lambda) * redundancy
+        best = max(remaining, key=mmr_score)
+        selected.append(best)
+        remaining.remove(best)
+    return selected
+
+def search_index(chunks, index, qv, k=5):
+    """Search with an already encoded query vector and return the scored chunks."""
     D, I = index.search(qv, k)
-    return [chunks[i] for i in I[0]]
+    # FAISS pads with -1 when k exceeds the number of chunks
+    return [dict(chunks[i], score=float(d)) for d, i in zip(D[0], I[0]) if i >= 0]
+
+@lru_cache(maxsize=None)
+def get_library():
+    return ArticleLibrary(
+        os.getenv("LIBRARY_DIR", ".cache/library"),
+        ivf_threshold=int(os.getenv("LIBRARY_IVF_THRESHOLD", "50000")),
+    )
+
+def add_to_library(source, chunks, vecs):
+    """Add an article's chunks to the cross-session library."""
+    return get_library().add_article(source, chunks, vecs)
+
+def retrieve_from_library(query, k=5, article=None):
+    """Retrieve chunks from every studied article, or only from ``article`` (its source)."""
+    model = get_model()
+    qv = model.encode([query], normalize_embeddings=True).astype("float32")
+    return get_library().search(qv, k, article=article)[0]
 
 def load_prompts(prompts_dir="prompts"):
     """Load all prompt files from the prompts directory."""
@@ -36,19 +198,194 @@ def load_prompts(prompts_dir="prompts"):
             prompts[name] = f.read().strip()
     return prompts
 
-def run_all_prompts(context_chunks, level="B1", test_mode=False):
-    """Run all prompts through the LLM with the given context."""
-    context = "\n\n---\n\n".join([chunk["text"] for chunk in context_chunks])
+def load_queries(prompts_dir="prompts", default="vocabulary and grammar concepts"):
+    """Retrieval query for each prompt, from queries.json next to the templates."""
+    path = Path(prompts_dir) / "queries.json"
+    queries = json.loads(path.read_text(encoding="utf-8")) if path.exists() else {}
+    return {name: queries.get(name, default) for name in load_prompts(prompts_dir)}
+
+def merge_hits(hits_by_prompt):
+    """Union of per-prompt hits, each chunk once with its best score."""
+    merged = {}
+    for hits in hits_by_prompt.values():
+        for hit in hits:
+            if hit["id"] not in merged or hit.get("score", 0.0) > merged[hit["id"]].get("score", 0.0):
+                merged[hit["id"]] = hit
+    return list(merged.values())
+
+def assemble_contexts(context_chunks, prompts, source_text=None, max_context_tokens=MAX_CONTEXT_TOKENS):
+    """Context per prompt name, plus a shared one for combined requests.
+
+    ``context_chunks`` is either one list of chunks used for every prompt or
+    a ``{name: chunks}`` dict from retrieve_multi.
+    """
+    if not isinstance(context_chunks, dict):
+        context = assemble_context(context_chunks, source_text, max_context_tokens)
+        return {name: context for name in prompts}, context
+    contexts = {name: assemble_context(context_chunks.get(name, []), source_text, max_context_tokens) for name in prompts}
+    return contexts, assemble_context(merge_hits(context_chunks), source_text, max_context_tokens)
+
+def build_prompt(context, level, prompt_template):
+    """Assemble the full prompt for one template from the assembled context."""
+    return f"""Context:\n{context}\n\nStudent Level: {level}\n\n{prompt_template}"""
+
+def build_combined_prompt(context, level, prompts):
+    """One prompt that carries the context once and asks for every template's output."""
+    sections = "\n\n".join(f"### {name}\n{template}" for name, template in prompts.items())
+    keys = ", ".join(f'"{name}"' for name in prompts)
+    return f"""Context:\n{context}\n\nStudent Level: {level}\n\n{COMBINED_MARKER}\n\n{sections}\n\nReturn a single JSON object with the keys {keys}, where each value is the JSON object that task asks for.\nOnly return JSON"""
+
+def split_combined_output(text, names):
+    """Split a combined reply into ``{name: output}``, skipping names it doesn't contain."""
+    start, end = text.find("{"), text.rfind("}")
+    try:
+        data = json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    return {name: json.dumps(data[name], ensure_ascii=False) for name in names if isinstance(data.get(name), dict)}
+
+def estimate_input_tokens(context_chunks, level="B1", source_text=None, max_context_tokens=MAX_CONTEXT_TOKENS):
+    """Estimated input tokens per generation for each mode, and how many combined saves."""
+    prompts = load_prompts()
+    contexts, shared = assemble_contexts(context_chunks, prompts, source_text, max_context_tokens)
+    system = estimate_claude_tokens(SYSTEM_PROMPT)
+    separate = sum(system + estimate_claude_tokens(build_prompt(contexts[name], level, t)) for name, t in prompts.items())
+    combined = system + estimate_claude_tokens(build_combined_prompt(shared, level, prompts))
+    return {"separate": separate, "combined": combined, "saved": separate - combined}
+
+def run_all_prompts(context_chunks, level="B1", test_mode=False, max_concurrency=MAX_CONCURRENCY, timeout=PROMPT_TIMEOUT, source_text=None, max_context_tokens=MAX_CONTEXT_TOKENS, mode=GENERATION_MODE):
+    """Run all prompts through the LLM with the given context.
+
+    Prompts are sent concurrently (at most ``max_concurrency`` at a time), so the
+    total wait is roughly that of the slowest call. A prompt that fails or times
+    out gets a GenerationFailed error message as its output instead of sinking
+    the others.
+
+    ``context_chunks`` is one list of chunks shared by every prompt, or a
+    ``{name: chunks}`` dict (see retrieve_multi) giving each prompt its own.
+    Pass the full ``source_text`` the chunks were cut from so overlapping chunks
+    can be merged back into contiguous passages; each context is trimmed to
+    ``max_context_tokens`` either way.
+
+    With ``mode="combined"`` the context is sent once in a single request for
+    all templates; anything missing from that reply is retried per template.
+    """
     prompts = load_prompts()
+    if not prompts:
+        return {}
+    contexts, shared = assemble_contexts(context_chunks, prompts, source_text, max_context_tokens)
+
     results = {}
+    if mode == "combined":
+        prompt = build_combined_prompt(shared, level, prompts)
+        # Only the request itself may fail over to separate requests; anything else is a bug and propagates
+        try:
+            with span("prompt", prompt="combined"):
+                text = call_llm(prompt, test_mode=test_mode, timeout=timeout)
+        except Exception as e:
+            logger.warning("Combined generation failed, falling back to separate requests: %r", e)
+            text = ""
+        results = split_combined_output(text, prompts)
+        if len(results) == len(prompts):
+            return {name: results[name] for name in prompts}
 
-    for name, prompt_template in prompts.items():
-        full_prompt = f"""Context:\n{context}\n\nStudent Level: {level}\n\n{prompt_template}"""
-        results[name] = call_llm(full_prompt, test_mode=test_mode)
+    def run_one(name, prompt_template):
+        with span("prompt", prompt=name):
+            return call_llm(build_prompt(contexts[name], level, prompt_template), test_mode=test_mode, timeout=timeout)
 
-    return results
+    remaining = {name: t for name, t in prompts.items() if name not in results}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(remaining)))) as pool:
+        futures = {name: pool.submit(propagate(run_one), name, template) for name, template in remaining.items()}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                results[name] = GenerationFailed(f"Error generating {name}: {e}")
+
+    return {name: results[name] for name in prompts}
+
+def stream_all_prompts(context_chunks, level="B1", test_mode=False, max_concurrency=MAX_CONCURRENCY, timeout=PROMPT_TIMEOUT, source_text=None, max_context_tokens=MAX_CONTEXT_TOKENS, mode=GENERATION_MODE):
+    """Streaming counterpart of run_all_prompts.
+
+    Yields ``(kind, name, value)`` events from the calling thread while the
+    prompts stream concurrently in the background:
+
+    - ``("item", name, (key, obj))`` whenever a vocabulary item, question or
+      dialogue line has been fully received
+    - ``("done", name, text)`` with the complete output of a prompt
+    - ``("error", name, message)`` if a prompt failed
+
+    Every prompt ends with exactly one "done" or "error" event, so collecting
+    those gives the same ``{name: output}`` dict run_all_prompts returns. In
+    combined mode items arrive under the name ``"combined"``.
+    """
+    prompts = load_prompts()
+    contexts, shared = assemble_contexts(context_chunks, prompts, source_text, max_context_tokens)
+    events = queue.Queue()
+    slots = threading.Semaphore(max(1, max_concurrency))
+
+    def stream_one(name, prompt):
+        parser = JsonItemStream()
+        parts = []
+        with span("prompt", prompt=name):
+            for delta in stream_llm(prompt, test_mode=test_mode, timeout=timeout):
+                parts.append(delta)
+                for item in parser.feed(delta):
+                    events.put(("item", name, item))
+        return "".join(parts)
+
+    def run_one(name, prompt_template):
+        with slots:
+            try:
+                events.put(("done", name, stream_one(name, build_prompt(contexts[name], level, prompt_template))))
+            except Exception as e:
+                events.put(("error", name, GenerationFailed(f"Error generating {name}: {e}")))
 
-def get_sentence_feedback(sentence, target_word, level, test_mode=False):
+    def run_combined():
+        prompt = build_combined_prompt(shared, level, prompts)
+        try:
+            text = stream_one("combined", prompt)
+        except Exception as e:
+            logger.warning("Combined generation failed, falling back to separate requests: %r", e)
+            text = ""
+        results = split_combined_output(text, prompts)
+        for name, output in results.items():
+            events.put(("done", name, output))
+        for name, template in prompts.items():
+            if name not in results:
+                threading.Thread(target=propagate(run_one), args=(name, template), daemon=True).start()
+
+    if mode == "combined":
+        threading.Thread(target=propagate(run_combined), daemon=True).start()
+    else:
+        for name, template in prompts.items():
+            threading.Thread(target=propagate(run_one), args=(name, template), daemon=True).start()
+
+    remaining = len(prompts)
+    while remaining:
+        event = events.get()
+        if event[0] != "item":
+            remaining -= 1
+        yield event
+
+def repair_output(name, output, error, test_mode=False, timeout=PROMPT_TIMEOUT):
+    """Ask the model once to fix an output that didn't parse as its template's JSON."""
+    template = load_prompts().get(name, "")
+    prompt = f"""Your previous answer to the task below could not be used because it was not valid JSON in the requested format ({error}).
+
+Task:
+{template}
+
+Previous answer:
+{output}
+
+Return only the corrected JSON."""
+    with span("prompt", prompt=f"{name}.repair"):
+        return call_llm(prompt, test_mode=test_mode, timeout=timeout)
+
+def get_sentence_feedback(sentence, target_word, level, test_mode=False, timeout=FEEDBACK_TIMEOUT):
     """Get grammar feedback and natural language suggestions for a practice sentence."""
     prompt = f"""You are a patient Spanish teacher helping a {level}-level student practice using the word "{target_word}" in a sentence.
 
@@ -61,9 +398,10 @@ Please provide:
 
 Keep your response friendly, clear, and concise (3-4 sentences max)."""
 
-    return call_llm(prompt, test_mode=test_mode)
+    with span("prompt", prompt="sentence_feedback"):
+        return call_llm(prompt, test_mode=test_mode, timeout=timeout)
 
-def get_comprehension_feedback(question, student_answer, expected_answer, level, test_mode=False):
+def get_comprehension_feedback(question, student_answer, expected_answer, level, test_mode=False, timeout=FEEDBACK_TIMEOUT):
     """Get feedback on a comprehension question answer."""
     prompt = f"""You are a patient Spanish teacher helping a {level}-level student with comprehension.
 
@@ -78,5 +416,125 @@ Please provide:
 
 Keep your response friendly, clear, and concise (3-4 sentences max)."""
 
-    return call_llm(prompt, test_mode=test_mode)
+    with span("prompt", prompt="comprehension_feedback"):
+        return call_llm(prompt, test_mode=test_mode, timeout=timeout)
+
+
+def normalize_answer(text):
+    """Canonical form used to spot resubmissions: case, spacing and edge punctuation ignored."""
+    return re.sub(r"\s+", " ", text).strip().strip(".,;:!?¡¿\"'").strip().casefold()
+
+SENTENCE_BATCH_INSTRUCTIONS = """For every item provide:
+1. Grammar feedback - Is the sentence grammatically correct? Point out any errors.
+2. Natural language - Suggest a more natural way to say this if needed.
+3. Encouragement - Give positive feedback on what they did well."""
+
+COMPREHENSION_BATCH_INSTRUCTIONS = """For every item provide:
+1. Accuracy - Is their answer correct? If not, gently explain what they missed.
+2. Language quality - Comment on their Spanish grammar and vocabulary.
+3. Encouragement - Give positive feedback and suggest how to improve."""
+
+def _grade_batch(items, key, render_item, preamble, instructions, grade_one, mode, test_mode, max_concurrency, timeout):
+    """Shared machinery for the batch graders.
+
+    Items with the same ``key`` are graded once. In "single" mode every unique
+    item goes into one structured request; anything missing from its reply,
+    and every item in "fanout" mode, is graded with ``grade_one`` on a bounded
+    thread pool. If the structured request is rate limited or runs out of
+    time, every item gets the error instead. Returns feedback in the order of
+    ``items``.
+    """
+    unique = {}
+    for item in items:
+        unique.setdefault(key(item), item)
+    keys = list(unique)
+    feedback = {}
+
+    if mode == "single" and keys:
+        blocks = "\n\n".join(f"Item {n}\n{render_item(unique[k])}" for n, k in enumerate(keys, 1))
+        prompt = f"""{preamble} {BATCH_GRADING_MARKER}
+
+{blocks}
+
+{instructions}
+
+Keep each item's feedback friendly, clear, and concise (3-4 sentences max).
+
+Return {{"feedback":[{{"item":1,"feedback":"..."}}]}} with one entry per item.
+Only return JSON"""
+        try:
+            with span("prompt", prompt="batch_feedback", items=len(keys)):
+                reply = call_llm(prompt, test_mode=test_mode, timeout=timeout)
+        except Exception as e:
+            # Out of time or still rate limited: one request per item would only make that worse
+            if isinstance(e, DeadlineExceeded) or retry_policy.is_retryable(e):
+                return [f"Couldn't get feedback: {e}" for _ in items]
+            logger.warning("Batch grading failed, grading items one at a time: %r", e)
+            reply = None
+        entries = []
+        if reply is not None:
+            try:
+                entries = extract_json(reply).get("feedback", [])
+            except ValueError as e:
+                logger.warning("Batch grading reply wasn't JSON, grading items one at a time: %s", e)
+        for entry in entries if isinstance(entries, list) else []:
+            # A malformed entry only costs that item a separate request
+            try:
+                n, text = int(entry["item"]), entry["feedback"]
+            except (KeyError, TypeError, ValueError):
+                continue
+            if 1 <= n <= len(keys) and text:
+                feedback[keys[n - 1]] = text
+
+    missing = [k for k in keys if k not in feedback]
+    if missing:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(missing)))) as pool:
+            futures = {k: pool.submit(propagate(grade_one), unique[k]) for k in missing}
+            for k, future in futures.items():
+                try:
+                    feedback[k] = future.result()
+                except Exception as e:
+                    feedback[k] = f"Couldn't get feedback: {e}"
+
+    return [feedback[key(item)] for item in items]
+
+def grade_sentences(items, level, test_mode=False, mode="single", max_concurrency=MAX_CONCURRENCY, timeout=FEEDBACK_TIMEOUT):
+    """Feedback for many practice sentences at once.
+
+    ``items`` are ``(sentence, target_word)`` pairs; returns one feedback
+    string per item, in order. ``mode`` is "single" (one structured request)
+    or "fanout" (one request per unique item, run concurrently). ``timeout``
+    bounds each request, retries included.
+    """
+    return _grade_batch(
+        items,
+        key=lambda item: (normalize_answer(item[0]), item[1].casefold()),
+        render_item=lambda item: f'Target word: "{item[1]}"\nStudent\'s sentence: "{item[0]}"',
+        preamble=f"You are a patient Spanish teacher helping a {level}-level student practice using words in sentences.",
+        instructions=SENTENCE_BATCH_INSTRUCTIONS,
+        grade_one=lambda item: get_sentence_feedback(item[0], item[1], level, test_mode, timeout),
+        mode=mode,
+        test_mode=test_mode,
+        max_concurrency=max_concurrency,
+        timeout=timeout,
+    )
+
+def grade_comprehension_answers(items, level, test_mode=False, mode="single", max_concurrency=MAX_CONCURRENCY, timeout=FEEDBACK_TIMEOUT):
+    """Feedback for many comprehension answers at once.
 
+    ``items`` are ``(question, student_answer, expected_answer)`` tuples;
+    returns one feedback string per item, in order. See grade_sentences for
+    ``mode``.
+    """
+    return _grade_batch(
+        items,
+        key=lambda item: (item[0], normalize_answer(item[1])),
+        render_item=lambda item: f'Question: {item[0]}\nExpected answer: {item[2]}\nStudent\'s answer: "{item[1]}"',
+        preamble=f"You are a patient Spanish teacher helping a {level}-level student with comprehension.",
+        instructions=COMPREHENSION_BATCH_INSTRUCTIONS,
+        grade_one=lambda item: get_comprehension_feedback(item[0], item[1], item[2], level, test_mode, timeout),
+        mode=mode,
+        test_mode=test_mode,
+        max_concurrency=max_concurrency,
+        timeout=timeout,
+    )
@@ -0,0 +1,56 @@
+import pytest
+
+import utils.cache
+from utils.cache import ResponseCache
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(utils.cache.time, "time", lambda: now[0])
+    return now
+
+def test_round_trip_and_stats(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"))
+    assert cache.get("k") is None
+    cache.set("k", "hola")
+    assert cache.get("k") == "hola"
+    assert cache.stats() == {"hits": 1, "misses": 1, "entries": 1, "bytes": 4}
+
+def test_entries_expire_after_ttl(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"), ttl=60)
+    cache.set("k", "hola")
+    clock[0] += 59
+    assert cache.get("k") == "hola"
+    clock[0] += 2
+    assert cache.get("k") is None
+    assert cache.stats()["entries"] == 0
+
+def test_least_recently_used_entry_is_evicted(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"), max_entries=2)
+    cache.set("a", "1")
+    clock[0] += 1
+    cache.set("b", "2")
+    clock[0] += 1
+    assert cache.get("a") == "1"  # a is now more recent than b
+    clock[0] += 1
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1" and cache.get("c") == "3"
+
+def test_evicts_down_to_max_bytes(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"), max_bytes=10)
+    for key in "abc":
+        cache.set(key, "xxxx")
+        clock[0] += 1
+    assert cache.get("a") is None
+    assert cache.stats()["bytes"] == 8
+
+def test_survives_reopening(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite3")
+    ResponseCache(path).set("k", "hola")
+    assert ResponseCache(path).get("k") == "hola"
+
+def test_key_depends_on_every_part():
+    key = ResponseCache.make_key(model="m", prompt="p", temperature=0.2)
+    assert key == ResponseCache.make_key(temperature=0.2, prompt="p", model="m")
+    assert key != ResponseCache.make_key(model="m", prompt="p", temperature=0.3)
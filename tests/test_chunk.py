@@ -0,0 +1,49 @@
+from bench import spanish_corpus
+from utils.chunk import chunk_text, iter_spans
+
+def baseline_chunk_text(t, size=1200, overlap=200):
+    # chunk_text before the offset-based rewrite
+    words = t.split()
+    out = []
+    i = 0
+    while i < len(words):
+        out.append({"id": len(out), "text": " ".join(words[i:i + size])})
+        i += max(1, size - overlap)
+    return out
+
+def baseline_windows(t, size, overlap):
+    """The baseline's windows as word lists, minus trailing ones made only of overlap."""
+    windows = [c["text"].split() for c in baseline_chunk_text(t, size, overlap)]
+    while len(windows) > 1 and len(windows[-1]) <= overlap:
+        windows.pop()
+    return windows
+
+def test_word_mode_matches_baseline_windows():
+    text = spanish_corpus(40_000)
+    for size, overlap in [(1200, 200), (100, 20), (50, 0), (10, 9)]:
+        assert [c["text"].split() for c in chunk_text(text, size, overlap)] == baseline_windows(text, size, overlap)
+
+def test_short_and_empty_text():
+    assert chunk_text("") == []
+    assert [c["text"] for c in chunk_text("  hola   mundo ")] == ["hola   mundo"]
+
+def test_offsets_point_into_source():
+    text = "Uno dos.\n\nTres   cuatro, cinco.  Seis siete ocho."
+    for by in ("word", "sentence"):
+        for c in chunk_text(text, size=3, overlap=1, by=by):
+            assert text[c["start"]:c["end"]] == c["text"]
+
+def test_sentence_mode_keeps_sentences_whole():
+    text = spanish_corpus(5_000)
+    # The corpus is cut at a byte count, so only the last chunk may end mid-sentence
+    for start, end in list(iter_spans(text, size=40, overlap=10, by="sentence"))[:-1]:
+        assert text[start:end].rstrip("\"'»”)]").endswith((".", "!", "?", "…"))
+
+def test_token_budget():
+    text = spanish_corpus(5_000)
+    count = lambda s: len(s)  # one token per character
+    spans = list(iter_spans(text, size=300, overlap=50, count_tokens=count))
+    longest_word = max(len(w) for w in text.split())
+    # A chunk closes as soon as it reaches the budget, so it is at most one word over
+    assert all(len("".join(text[start:end].split())) < 300 + longest_word for start, end in spans)
+    assert spans[0][0] == 0 and spans[-1][1] == len(text.rstrip())
@@ -0,0 +1,47 @@
+from bench import spanish_corpus
+from utils.chunk import chunk_text
+from utils.context import SEPARATOR, assemble_context, merge_spans
+
+def words(text):
+    return len(text.split())
+
+def hits_for(chunks, scores):
+    return [dict(chunks[i], score=score) for i, score in scores.items()]
+
+def test_overlapping_hits_merge_into_one_passage():
+    text = spanish_corpus(20_000)
+    chunks = chunk_text(text, size=200, overlap=50)
+    context = assemble_context(hits_for(chunks, {2: 0.5, 1: 0.9}), text)
+    # Chunks 1 and 2 share 50 words, which must appear once
+    assert SEPARATOR not in context
+    assert context == text[chunks[1]["start"]:chunks[2]["end"]].strip()
+
+def test_passages_in_document_order():
+    text = spanish_corpus(20_000)
+    chunks = chunk_text(text, size=100, overlap=0)
+    context = assemble_context(hits_for(chunks, {7: 0.9, 2: 0.8, 5: 0.1}), text)
+    assert context.split(SEPARATOR) == [chunks[i]["text"] for i in (2, 5, 7)]
+
+def test_output_respects_budget():
+    text = spanish_corpus(50_000)
+    chunks = chunk_text(text, size=120, overlap=30)
+    hits = hits_for(chunks, {i: 1.0 - i / 100 for i in range(0, len(chunks), 3)})
+    for budget in (1, 50, 333, 1000):
+        context = assemble_context(hits, text, max_tokens=budget, count_tokens=words)
+        assert 0 < words(context.replace(SEPARATOR, " ")) <= budget
+
+def test_budget_goes_to_best_scores():
+    text = spanish_corpus(20_000)
+    chunks = chunk_text(text, size=100, overlap=0)
+    context = assemble_context(hits_for(chunks, {1: 0.2, 4: 0.9}), text, max_tokens=100, count_tokens=words)
+    assert context == chunks[4]["text"]
+
+def test_hits_without_offsets_drop_duplicates():
+    hits = [{"text": "uno dos", "score": 0.5}, {"text": "tres", "score": 0.9}, {"text": "uno dos", "score": 0.4}]
+    assert assemble_context(hits).split(SEPARATOR) == ["uno dos", "tres"]
+    assert assemble_context(hits, max_tokens=1, count_tokens=words) == "tres"
+
+def test_merge_spans_joins_touching_hits():
+    source = "aaaa bbbb  cccc dddd"
+    hits = [{"start": 11, "end": 15, "score": 0.3}, {"start": 0, "end": 4, "score": 0.1}, {"start": 5, "end": 9, "score": 0.7}]
+    assert merge_spans(hits, source) == [[0, 15, 0.7]]
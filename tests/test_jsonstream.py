@@ -0,0 +1,35 @@
+import json
+
+from utils.jsonstream import JsonItemStream
+
+PAYLOAD = {
+    "title": "En el {Mercado}",
+    "vocabulary": [
+        {"spanish": "casa", "english": "house", "example": "Dijo \"hola\" y se fue, [sin más]."},
+        {"spanish": "llave", "english": "key", "tags": [{"level": "A1"}]},
+    ],
+    "questions": [{"question": "¿Qué es {esto}?", "answer": "Una casa."}],
+    "glossary": [{"spanish": "kilo", "english": "kilogram"}],
+}
+
+def stream(text, step):
+    parser = JsonItemStream()
+    items = []
+    for i in range(0, len(text), step):
+        items += parser.feed(text[i:i + step])
+    return items
+
+def test_items_arrive_whole_whatever_the_delta_size():
+    text = "```json\n" + json.dumps(PAYLOAD, ensure_ascii=False, indent=2) + "\n```"
+    expected = [("vocabulary", item) for item in PAYLOAD["vocabulary"]] + [("questions", PAYLOAD["questions"][0])]
+    for step in (1, 2, 7, 64, len(text)):
+        assert stream(text, step) == expected
+
+def test_item_is_emitted_as_soon_as_it_closes():
+    parser = JsonItemStream()
+    assert parser.feed('{"vocabulary": [{"spanish": "ca') == []
+    assert parser.feed('sa"}, {"spanish"') == [("vocabulary", {"spanish": "casa"})]
+
+def test_unlisted_keys_are_ignored():
+    parser = JsonItemStream(keys=("glossary",))
+    assert parser.feed(json.dumps(PAYLOAD)) == [("glossary", PAYLOAD["glossary"][0])]
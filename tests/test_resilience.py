@@ -0,0 +1,105 @@
+import threading
+import time
+
+import pytest
+
+from utils.resilience import DeadlineExceeded, RetryPolicy, SingleFlight, TokenBucket
+
+class ApiError(Exception):
+    def __init__(self, status_code, retry_after=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.response = type("Response", (), {"headers": {"retry-after": retry_after} if retry_after else {}})()
+
+def test_retries_transient_errors_then_succeeds():
+    calls, sleeps = [], []
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise ApiError(529)
+        return "ok"
+    assert RetryPolicy(max_retries=5, base_delay=0.01).call(flaky, sleep=sleeps.append) == "ok"
+    assert len(calls) == 3 and len(sleeps) == 2
+
+def test_does_not_retry_client_errors():
+    calls = []
+    def bad():
+        calls.append(1)
+        raise ApiError(400)
+    with pytest.raises(ApiError):
+        RetryPolicy().call(bad, sleep=lambda s: None)
+    assert len(calls) == 1
+
+def test_honours_retry_after():
+    assert RetryPolicy(max_delay=60).delay_for(ApiError(429, retry_after="7"), 0) == 7.0
+    assert RetryPolicy(max_delay=5).delay_for(ApiError(429, retry_after="7"), 0) == 5.0
+
+def test_retry_deadline_holds():
+    def always_rate_limited():
+        raise ApiError(429, retry_after="0.2")
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        RetryPolicy(max_retries=100).call(always_rate_limited, deadline=started + 1.0)
+    # Gives up before a sleep would cross the deadline rather than after it
+    assert time.monotonic() - started < 1.0
+
+def test_deadline_exceeded_is_not_retried():
+    assert not RetryPolicy().is_retryable(DeadlineExceeded("late"))
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(per_minute=600, capacity=1)  # 10 per second
+    bucket.acquire()
+    started = time.monotonic()
+    bucket.acquire()
+    assert 0.05 < time.monotonic() - started < 0.5
+
+def test_token_bucket_raises_instead_of_waiting_past_deadline():
+    bucket = TokenBucket(per_minute=60, capacity=1)
+    bucket.acquire()
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        bucket.acquire(deadline=started + 0.1)
+    assert time.monotonic() - started < 0.1
+
+def test_token_bucket_off_at_zero_rate():
+    bucket = TokenBucket(per_minute=0)
+    for _ in range(1000):
+        bucket.acquire()
+
+def test_single_flight_coalesces_concurrent_calls():
+    flight = SingleFlight()
+    calls, results = [], []
+    release = threading.Event()
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return "shared"
+    threads = [threading.Thread(target=lambda: results.append(flight.do("k", slow))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    while flight.coalesced < 4:
+        time.sleep(0.01)
+    release.set()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1 and results == ["shared"] * 5
+
+def test_single_flight_shares_exceptions_and_forgets_key():
+    flight = SingleFlight()
+    with pytest.raises(ValueError):
+        flight.do("k", lambda: (_ for _ in ()).throw(ValueError("boom")))
+    assert flight.do("k", lambda: "fresh") == "fresh"
+
+def test_single_flight_follower_stops_at_its_deadline():
+    flight = SingleFlight()
+    release = threading.Event()
+    leader = threading.Thread(target=lambda: flight.do("k", lambda: release.wait(5)))
+    leader.start()
+    while "k" not in flight._inflight:
+        time.sleep(0.01)
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        flight.do("k", lambda: "unused", deadline=started + 0.1)
+    assert time.monotonic() - started < 1.0
+    release.set()
+    leader.join()
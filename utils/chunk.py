@@ -1,8 +1,61 @@
-def chunk_text(t:str, size=1200, overlap=200):
-    words = t.split()
-    out=[]; i=0
-    while i < len(words):
-        out.append({"id":len(out), "text":" ".join(words[i:i+size])})
-        i += max(1, size - overlap)
-    return out
+import math
+import re
+from collections import deque
 
+_WORD = re.compile(r"\S+")
+# A sentence runs up to terminal punctuation (plus closing quotes/brackets) or the end of the text
+_SENTENCE = re.compile(r"\S.*?(?:[.!?…]+[\"'»”)\]]*(?=\s|$)|$)", re.S)
+
+def _units(t, by):
+    pattern = _SENTENCE if by == "sentence" else _WORD
+    for m in pattern.finditer(t):
+        yield m.start(), m.end()
+
+def iter_spans(t:str, size=1200, overlap=200, by="word", count_tokens=None):
+    """Yield chunks of ``t`` as ``(start, end)`` character offsets.
+
+    Chunks are built from whole words (``by="word"``) or whole sentences
+    (``by="sentence"``) and hold about ``size`` words, with roughly ``overlap``
+    words shared between neighbours. Pass ``count_tokens`` (a function from
+    text to a token count) to measure ``size`` and ``overlap`` in tokens
+    instead. Only the current window is held in memory; the text itself is
+    never copied.
+    """
+    if count_tokens is None:
+        measure = (lambda s, e: 1) if by == "word" else (lambda s, e: len(_WORD.findall(t, s, e)))
+    else:
+        measure = lambda s, e: count_tokens(t[s:e])
+
+    window = deque()
+    total = 0
+    fresh = False   # whether the window holds units not yet emitted
+    for s, e in _units(t, by):
+        n = measure(s, e)
+        window.append((s, e, n))
+        total += n
+        fresh = True
+        if total >= size:
+            yield window[0][0], window[-1][1]
+            fresh = False
+            # Always drop at least one unit so the window keeps moving
+            s0, e0, n0 = window.popleft()
+            total -= n0
+            while window and total > overlap:
+                total -= window.popleft()[2]
+    if fresh:
+        yield window[0][0], window[-1][1]
+
+def chunk_text(t:str, size=1200, overlap=200, by="word", count_tokens=None):
+    """Split text into chunk dicts with ``id``, ``text`` and source ``start``/``end`` offsets."""
+    return [
+        {"id": i, "text": t[start:end], "start": start, "end": end}
+        for i, (start, end) in enumerate(iter_spans(t, size, overlap, by, count_tokens))
+    ]
+
+def estimate_claude_tokens(text:str)->int:
+    """Rough Claude token count (about 3.5 characters per token for Spanish prose)."""
+    return max(1, math.ceil(len(text) / 3.5))
+
+def tokenizer_counter(tokenizer):
+    """Token counter for a Hugging Face tokenizer, e.g. ``get_model().tokenizer`` for MiniLM."""
+    return lambda text: len(tokenizer(text, add_special_tokens=False)["input_ids"])
@@ -0,0 +1,95 @@
+from utils.chunk import estimate_claude_tokens
+
+SEPARATOR = "\n\n---\n\n"
+
+def _trim(text, budget, count_tokens):
+    """Longest word-boundary prefix of ``text`` that fits in ``budget`` tokens."""
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(text[:mid]) <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    cut = text.rfind(" ", 0, lo) if lo < len(text) else lo
+    return text[:cut if cut > 0 else lo].rstrip()
+
+def merge_spans(hits, source):
+    """Merge hits that overlap or touch in ``source`` into contiguous spans.
+
+    Returns ``[start, end, score]`` lists in document order, where score is
+    the best retrieval score among the merged hits.
+    """
+    spans = sorted((h["start"], h["end"], h.get("score", 0.0)) for h in hits)
+    merged = []
+    for start, end, score in spans:
+        if merged and (start <= merged[-1][1] or not source[merged[-1][1]:start].strip()):
+            merged[-1][1] = max(merged[-1][1], end)
+            merged[-1][2] = max(merged[-1][2], score)
+        else:
+            merged.append([start, end, score])
+    return merged
+
+def _uncovered(start, end, covered):
+    """Parts of [start, end) not already in the sorted, disjoint ``covered`` intervals."""
+    pieces = []
+    for a, b in covered:
+        if b <= start or a >= end:
+            continue
+        if a > start:
+            pieces.append((start, a))
+        start = max(start, b)
+    if start < end:
+        pieces.append((start, end))
+    return pieces
+
+def assemble_context(hits, source=None, max_tokens=None, count_tokens=estimate_claude_tokens):
+    """Turn retrieved chunks into a deduplicated prompt context.
+
+    When the hits carry ``start``/``end`` offsets into ``source``, overlapping
+    and adjacent hits are merged back into contiguous passages so shared text
+    appears only once; otherwise identical texts are dropped. If
+    ``max_tokens`` is set, hits are taken in order of retrieval score and
+    charged only for text not already included, until the budget runs out
+    (the last one may be trimmed). Passages are always emitted in document
+    order.
+    """
+    budget = max_tokens if max_tokens is not None else float("inf")
+    ranked = sorted(enumerate(hits), key=lambda p: -p[1].get("score", 0.0))
+
+    if source is not None and hits and all("start" in h and "end" in h for h in hits):
+        covered = []
+        for _, h in ranked:
+            if budget <= 0:
+                break
+            for a, b in _uncovered(h["start"], h["end"], covered):
+                cost = count_tokens(source[a:b])
+                if cost > budget:
+                    b = a + len(_trim(source[a:b], budget, count_tokens))
+                    cost = budget
+                if b > a:
+                    covered.append((a, b))
+                    budget -= cost
+                if budget <= 0:
+                    break
+            covered.sort()
+        spans = merge_spans([{"start": a, "end": b} for a, b in covered], source)
+        return SEPARATOR.join(source[start:end].strip() for start, end, _ in spans)
+
+    seen = set()
+    kept = []
+    for position, h in ranked:
+        if budget <= 0:
+            break
+        if h["text"] in seen:
+            continue
+        seen.add(h["text"])
+        text = h["text"]
+        cost = count_tokens(text)
+        if cost > budget:
+            text = _trim(text, budget, count_tokens)
+            cost = budget
+        if text:
+            kept.append((position, text))
+            budget -= cost
+    return SEPARATOR.join(text for _, text in sorted(kept))
@@ -0,0 +1,159 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+class _Job:
+    """One encode call being worked through, possibly across several batches."""
+
+    def __init__(self, texts, normalize, future, submitted):
+        self.texts = texts
+        self.normalize = normalize
+        self.future = future
+        self.submitted = submitted
+        self.done = 0
+        self.parts = []
+
+    @property
+    def remaining(self):
+        return len(self.texts) - self.done
+
+class EmbeddingService:
+    """Micro-batching front end for an embedding backend.
+
+    Concurrent ``encode`` calls (e.g. from different Streamlit sessions) are
+    queued and a single worker thread packs them into backend calls of at
+    most ``max_batch`` texts, waiting up to ``max_wait_ms`` for a batch to
+    fill. Requests with the fewest texts left go first, and large requests
+    are encoded ``max_batch`` texts at a time, so a query never waits behind
+    a whole document, only behind one batch. If a batch fails, its requests
+    are retried one by one so only the one that caused it fails. Exposes the
+    same ``encode`` signature as the backends, so it can stand in for them.
+    """
+
+    def __init__(self, backend, max_batch=64, max_wait_ms=5):
+        self.backend = backend
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._pending = []
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.batches = 0
+        self.texts = 0
+        self.max_batch_seen = 0
+        self._waits = deque(maxlen=1000)
+        threading.Thread(target=self._run, name="embedding-service", daemon=True).start()
+
+    def __getattr__(self, name):
+        # Anything else (e.g. tokenizer) comes straight from the backend
+        return getattr(self.backend, name)
+
+    def encode(self, texts, normalize_embeddings=True):
+        texts = list(texts)
+        if not texts:
+            return self.backend.encode(texts, normalize_embeddings=normalize_embeddings)
+        future = Future()
+        self._queue.put(_Job(texts, normalize_embeddings, future, time.perf_counter()))
+        return future.result()
+
+    def _take(self, block, timeout=None):
+        """Move newly queued jobs into the pending list; returns how many arrived."""
+        arrived = 0
+        try:
+            job = self._queue.get(block=block, timeout=timeout)
+            while True:
+                self._pending.append(job)
+                arrived += 1
+                job = self._queue.get_nowait()
+        except queue.Empty:
+            pass
+        return arrived
+
+    def _collect(self):
+        """The next batch as ``(job, texts to take)`` pairs, smallest remainder first,
+        plus how many new requests arrived."""
+        arrived = self._take(block=not self._pending)
+        deadline = time.perf_counter() + self.max_wait
+        while sum(job.remaining for job in self._pending) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            taken = self._take(block=True, timeout=remaining) if remaining > 0 else 0
+            if not taken:
+                break
+            arrived += taken
+        # Stable sort: shortest remaining work first, arrival order among equals
+        order = sorted(self._pending, key=lambda job: job.remaining)
+        normalize = order[0].normalize
+        batch, room = [], self.max_batch
+        for job in order:
+            if room <= 0:
+                break
+            if job.normalize != normalize:
+                continue
+            take = min(room, job.remaining)
+            batch.append((job, take))
+            room -= take
+        return batch, arrived
+
+    def _run(self):
+        while True:
+            batch, arrived = self._collect()
+            started = time.perf_counter()
+            with self._lock:
+                self.requests += arrived
+            try:
+                self._encode(batch, started)
+            except Exception as e:
+                if len(batch) == 1:
+                    self._fail(batch[0][0], e)
+                    continue
+                # Retry each request on its own, so one session's bad input only fails that session
+                for part in batch:
+                    try:
+                        self._encode([part], started)
+                    except Exception as e:
+                        self._fail(part[0], e)
+
+    def _encode(self, batch, started):
+        """Encode one batch and hand each job its slice of the vectors."""
+        texts = [t for job, take in batch for t in job.texts[job.done:job.done + take]]
+        vecs = np.asarray(self.backend.encode(texts, normalize_embeddings=batch[0][0].normalize))
+        offset = 0
+        with self._lock:
+            self.batches += 1
+            self.texts += len(texts)
+            self.max_batch_seen = max(self.max_batch_seen, len(texts))
+            for job, take in batch:
+                if not job.done:
+                    self._waits.append(started - job.submitted)
+                job.parts.append(vecs[offset:offset + take])
+                job.done += take
+                offset += take
+                if not job.remaining:
+                    self._pending.remove(job)
+                    job.future.set_result(job.parts[0] if len(job.parts) == 1 else np.vstack(job.parts))
+
+    def _fail(self, job, error):
+        with self._lock:
+            self._pending.remove(job)
+        job.future.set_exception(error)
+
+    def stats(self):
+        """Queue depth, batching and queue-wait metrics since start."""
+        with self._lock:
+            waits = sorted(self._waits)
+            def percentile(p):
+                return waits[min(len(waits) - 1, int(p * len(waits)))] * 1000 if waits else 0.0
+            return {
+                "queue_depth": self._queue.qsize() + len(self._pending),
+                "requests": self.requests,
+                "batches": self.batches,
+                "texts": self.texts,
+                "mean_batch_size": self.texts / self.batches if self.batches else 0.0,
+                "max_batch_size": self.max_batch_seen,
+                "queue_wait_p50_ms": percentile(0.5),
+                "queue_wait_p99_ms": percentile(0.99),
+            }
@@ -0,0 +1,149 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+# POSIX advisory locks keep the Streamlit server and batch.py from interleaving appends
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+def text_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+class EmbeddingStore:
+    """On-disk embedding store keyed by (model name, chunk-text hash).
+
+    Vectors live in one append-only float32 matrix per model that is read
+    through ``np.memmap``; a small SQLite table maps each text hash to its row.
+    Only texts that have never been seen are sent to the encoder. The store
+    also keeps serialized FAISS index snapshots, one per document, so an
+    article that was indexed before can be reopened without re-encoding or
+    re-indexing it.
+    """
+
+    def __init__(self, root, model_name):
+        self.dir = os.path.join(root, model_name.replace("/", "__"))
+        self.index_dir = os.path.join(self.dir, "indexes")
+        os.makedirs(self.index_dir, exist_ok=True)
+        self.vectors_path = os.path.join(self.dir, "vectors.f32")
+        self.meta_path = os.path.join(self.dir, "meta.json")
+        self.lock_path = os.path.join(self.dir, "append.lock")
+        self.dim = None
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                self.dim = json.load(f)["dim"]
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._matrix = None
+        with self._conn() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS rows (hash TEXT PRIMARY KEY, row INTEGER NOT NULL)")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(os.path.join(self.dir, "rows.sqlite3"), timeout=30)
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _append_lock(self):
+        """Exclusive across threads of this process and, where fcntl exists, across processes."""
+        with self._lock, open(self.lock_path, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _rows_on_disk(self):
+        if self.dim is None or not os.path.exists(self.vectors_path):
+            return 0
+        return os.path.getsize(self.vectors_path) // (self.dim * 4)
+
+    def _view(self):
+        """Memory-mapped view of every vector written so far."""
+        n = self._rows_on_disk()
+        if self._matrix is None or self._matrix.shape[0] != n:
+            self._matrix = np.memmap(self.vectors_path, dtype="float32", mode="r", shape=(n, self.dim)) if n else None
+        return self._matrix
+
+    def lookup(self, hashes):
+        """Map text hashes to stored rows, omitting the ones not in the store."""
+        found = {}
+        conn = self._conn()
+        # Stay well below SQLite's bound-parameter limit
+        for i in range(0, len(hashes), 500):
+            batch = hashes[i:i + 500]
+            marks = ",".join("?" * len(batch))
+            found.update(conn.execute(f"SELECT hash, row FROM rows WHERE hash IN ({marks})", batch).fetchall())
+        return found
+
+    def get_or_compute(self, texts, encode):
+        """Return a (len(texts), dim) float32 matrix, encoding only unseen texts.
+
+        ``encode`` is called at most once, with the list of missing texts, and
+        must return their normalized embeddings in the same order.
+        """
+        hashes = [text_hash(t) for t in texts]
+        rows = self.lookup(hashes)
+        missing = list(dict.fromkeys(h for h in hashes if h not in rows))
+        if missing:
+            by_hash = dict(zip(hashes, texts))
+            vecs = np.ascontiguousarray(encode([by_hash[h] for h in missing]), dtype="float32")
+            with self._append_lock():
+                if self.dim is None:
+                    if os.path.exists(self.meta_path):
+                        with open(self.meta_path) as f:
+                            self.dim = json.load(f)["dim"]
+                    else:
+                        self.dim = int(vecs.shape[1])
+                        with open(self.meta_path, "w") as f:
+                            json.dump({"dim": self.dim}, f)
+                row_bytes = self.dim * 4
+                with open(self.vectors_path, "ab") as f:
+                    size = f.seek(0, os.SEEK_END)
+                    if size % row_bytes:
+                        # A writer crashed mid-row; drop the partial row so later rows stay aligned
+                        f.truncate(size - size % row_bytes)
+                        f.seek(0, os.SEEK_END)
+                    start = f.tell() // row_bytes
+                    f.write(vecs.tobytes())
+                new_rows = {h: start + i for i, h in enumerate(missing)}
+                with self._conn() as conn:
+                    conn.executemany("INSERT OR REPLACE INTO rows (hash, row) VALUES (?, ?)", new_rows.items())
+            rows.update(new_rows)
+        if not texts:
+            return np.zeros((0, self.dim or 0), dtype="float32")
+        return np.asarray(self._view()[[rows[h] for h in hashes]])
+
+    def _index_path(self, doc_key):
+        return os.path.join(self.index_dir, f"{doc_key}.faiss")
+
+    def load_index(self, doc_key):
+        """Return the saved FAISS index for a document, or None."""
+        import faiss
+        path = self._index_path(doc_key)
+        return faiss.read_index(path) if os.path.exists(path) else None
+
+    def save_index(self, doc_key, index):
+        import faiss
+        # Write to a temp file first so concurrent readers never see a partial index
+        path = self._index_path(doc_key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        faiss.write_index(index, tmp)
+        os.replace(tmp, path)
+
+def document_key(texts):
+    """Stable key for a document made of the given chunk texts."""
+    h = hashlib.sha1()
+    for t in texts:
+        h.update(text_hash(t).encode("ascii"))
+    return h.hexdigest()
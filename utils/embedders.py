@@ -0,0 +1,142 @@
+import argparse
+import time
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+class EmbeddingBackend(ABC):
+    """Interface for the sentence embedders behind ``rag.get_model``.
+
+    Backends mirror the part of ``SentenceTransformer`` the app uses:
+    ``encode(texts, normalize_embeddings=True)`` returning a float32 matrix.
+    """
+
+    name = "base"
+
+    def __init__(self, model_name, batch_size=64, threads=None):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.threads = threads
+
+    @abstractmethod
+    def encode(self, texts, normalize_embeddings=True):
+        """Embed ``texts`` into a (len(texts), dim) float32 matrix."""
+
+class SentenceTransformerBackend(EmbeddingBackend):
+    """Full-precision PyTorch model via sentence-transformers (the baseline)."""
+
+    name = "torch"
+
+    def __init__(self, model_name, batch_size=64, threads=None):
+        super().__init__(model_name, batch_size, threads)
+        import torch
+        from sentence_transformers import SentenceTransformer
+        if threads:
+            torch.set_num_threads(threads)
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.tokenizer = self.model.tokenizer
+
+    def encode(self, texts, normalize_embeddings=True):
+        return self.model.encode(texts, batch_size=self.batch_size, normalize_embeddings=normalize_embeddings).astype("float32")
+
+class QuantizedTorchBackend(SentenceTransformerBackend):
+    """Same model with its Linear layers dynamically quantized to int8."""
+
+    name = "torch-int8"
+
+    def __init__(self, model_name, batch_size=64, threads=None):
+        super().__init__(model_name, batch_size, threads)
+        import torch
+        self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+
+class OnnxBackend(EmbeddingBackend):
+    """ONNX Runtime on CPU, using the ONNX exports published with the model.
+
+    ``onnx_file`` picks the export, e.g. ``onnx/model_qint8_avx512_vnni.onnx``
+    for the int8-quantized graph.
+    """
+
+    name = "onnx"
+    onnx_file = "onnx/model.onnx"
+
+    def __init__(self, model_name, batch_size=64, threads=None):
+        super().__init__(model_name, batch_size, threads)
+        import onnxruntime as ort
+        from huggingface_hub import hf_hub_download
+        from transformers import AutoTokenizer
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        path = hf_hub_download(model_name, self.onnx_file)
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def encode(self, texts, normalize_embeddings=True):
+        out = []
+        for i in range(0, len(texts), self.batch_size):
+            batch = self.tokenizer(texts[i:i + self.batch_size], padding=True, truncation=True, max_length=256, return_tensors="np")
+            feeds = {k: v.astype("int64") for k, v in batch.items() if k in self.input_names}
+            tokens = self.session.run(None, feeds)[0]
+            # Mean pooling over real (non-padding) tokens, as sentence-transformers does
+            mask = batch["attention_mask"][..., None].astype("float32")
+            out.append((tokens * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None))
+        vecs = np.vstack(out).astype("float32") if out else np.zeros((0, 0), dtype="float32")
+        if normalize_embeddings and len(vecs):
+            vecs /= np.clip(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12, None)
+        return vecs
+
+class QuantizedOnnxBackend(OnnxBackend):
+    name = "onnx-int8"
+    onnx_file = "onnx/model_qint8_avx512_vnni.onnx"
+
+BACKENDS = {b.name: b for b in (SentenceTransformerBackend, QuantizedTorchBackend, OnnxBackend, QuantizedOnnxBackend)}
+
+def make_backend(name, model_name, batch_size=64, threads=None):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend {name!r}; choose from {', '.join(BACKENDS)}")
+    return BACKENDS[name](model_name, batch_size=batch_size, threads=threads)
+
+def recall_at_k(candidate, baseline, texts, queries, k=5):
+    """Fraction of the baseline's top-k chunks per query that the candidate also retrieves."""
+    top = {}
+    for name, backend in (("baseline", baseline), ("candidate", candidate)):
+        docs = backend.encode(texts, normalize_embeddings=True)
+        qs = backend.encode(queries, normalize_embeddings=True)
+        top[name] = np.argsort(-(qs @ docs.T), axis=1)[:, :k]
+    found = sum(len(set(expected) & set(got)) for expected, got in zip(top["baseline"], top["candidate"]))
+    return found / (len(queries) * min(k, len(texts)))
+
+def throughput(backend, texts, repeats=3):
+    """Best-of-``repeats`` chunks encoded per second."""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        backend.encode(texts)
+        best = min(best, time.perf_counter() - start)
+    return len(texts) / best
+
+def main(argv=None):
+    from utils.chunk import chunk_text
+    parser = argparse.ArgumentParser(description="Compare an embedding backend's speed and retrieval recall with the fp32 baseline.")
+    parser.add_argument("corpus", help="plain-text file to chunk and index")
+    parser.add_argument("--backend", default="onnx-int8", choices=sorted(BACKENDS))
+    parser.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--queries", nargs="+", default=["vocabulary and grammar concepts", "main events of the story", "people and places", "opinions and arguments"])
+    parser.add_argument("--chunk-size", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    with open(args.corpus, encoding="utf-8") as f:
+        texts = [c["text"] for c in chunk_text(f.read(), size=args.chunk_size, overlap=args.chunk_size // 6)]
+    baseline = make_backend("torch", args.model, args.batch_size, args.threads)
+    candidate = make_backend(args.backend, args.model, args.batch_size, args.threads)
+    print(f"{len(texts)} chunks")
+    print(f"torch: {throughput(baseline, texts):.1f} chunks/s")
+    print(f"{args.backend}: {throughput(candidate, texts):.1f} chunks/s")
+    print(f"recall@{args.k} vs torch: {recall_at_k(candidate, baseline, texts, args.queries, args.k):.3f}")
+
+if __name__ == "__main__":
+    main()
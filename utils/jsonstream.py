@@ -0,0 +1,61 @@
+import json
+
+class JsonItemStream:
+    """Incrementally scan streamed JSON text and emit array items as they close.
+
+    Feed text deltas as they arrive from the model; ``feed`` returns the
+    ``(key, item)`` pairs for every object that has just been completed inside
+    an array stored under one of ``keys`` (e.g. each entry of
+    ``{"vocabulary": [...]}``). Text outside the JSON value, such as a
+    markdown code fence, is ignored.
+    """
+
+    def __init__(self, keys=("vocabulary", "questions", "lines")):
+        self.keys = set(keys)
+        self.buffer = ""
+        self._pos = 0
+        self._stack = []        # entries are [container, key, start]
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._last_string = None
+        self._current_key = None
+
+    def feed(self, delta):
+        self.buffer += delta
+        items = []
+        buf = self.buffer
+        for i in range(self._pos, len(buf)):
+            ch = buf[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    self._last_string = buf[self._string_start + 1:i]
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch == ":":
+                self._current_key = self._last_string
+            elif ch == ",":
+                self._current_key = None
+            elif ch in "{[":
+                parent = self._stack[-1] if self._stack else None
+                key = self._current_key if parent and parent[0] == "{" else None
+                self._stack.append([ch, key, i])
+                self._current_key = None
+            elif ch in "}]" and self._stack:
+                container, _, start = self._stack.pop()
+                parent = self._stack[-1] if self._stack else None
+                if container == "{" and parent and parent[0] == "[" and parent[1] in self.keys:
+                    try:
+                        items.append((parent[1], json.loads(buf[start:i + 1])))
+                    except json.JSONDecodeError:
+                        pass
+        self._pos = len(buf)
+        return items
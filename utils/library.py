@@ -0,0 +1,219 @@
+import atexit
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from utils.embed_store import document_key
+
+class ArticleLibrary:
+    """Long-lived vector index over every article a user has studied.
+
+    Articles are added incrementally and can be deleted again. Each vector's
+    FAISS id maps back to its source and chunk in a SQLite table. While the
+    library is small it is an exact ``IndexFlatIP``; once it holds
+    ``ivf_threshold`` vectors it is migrated to an ``IndexIVFFlat`` so search
+    stays sub-linear. Passing ``exact=True`` to ``search`` probes every IVF list,
+    which makes the search exhaustive again.
+
+    The index file is written by a background thread, at most once every
+    ``save_delay`` seconds, so adding an article never waits on disk.
+    """
+
+    def __init__(self, root, ivf_threshold=50000, nprobe=16, save_delay=2.0):
+        os.makedirs(root, exist_ok=True)
+        self.index_path = os.path.join(root, "library.faiss")
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(os.path.join(root, "library.sqlite3"), timeout=30, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS articles (
+                id INTEGER PRIMARY KEY,
+                source TEXT UNIQUE NOT NULL,
+                added REAL NOT NULL,
+                doc_key TEXT
+            )""")
+            # Libraries created before doc_key existed
+            if "doc_key" not in [r[1] for r in self._conn.execute("PRAGMA table_info(articles)")]:
+                self._conn.execute("ALTER TABLE articles ADD COLUMN doc_key TEXT")
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS chunks (
+                id INTEGER PRIMARY KEY,
+                article_id INTEGER NOT NULL,
+                chunk_id INTEGER NOT NULL,
+                text TEXT NOT NULL
+            )""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_article ON chunks(article_id)")
+        self._index = None
+        self._index_loaded = False
+        self.save_delay = save_delay
+        self._dirty = threading.Event()
+        self._saver = None
+        self._write_lock = threading.Lock()
+        atexit.register(self.flush)
+
+    @property
+    def index(self):
+        # Read lazily so listing articles doesn't pay for importing faiss or loading vectors
+        if not self._index_loaded:
+            import faiss
+            self._index = faiss.read_index(self.index_path) if os.path.exists(self.index_path) else None
+            self._index_loaded = True
+        return self._index
+
+    @index.setter
+    def index(self, value):
+        self._index = value
+        self._index_loaded = True
+
+    def __len__(self):
+        return self.index.ntotal if self.index is not None else 0
+
+    def articles(self):
+        """List ``{"id", "source", "chunks"}`` for every article in the library."""
+        with self._lock:
+            rows = self._conn.execute("""SELECT a.id, a.source, COUNT(c.id) FROM articles a
+                LEFT JOIN chunks c ON c.article_id = a.id GROUP BY a.id ORDER BY a.added""").fetchall()
+        return [{"id": r[0], "source": r[1], "chunks": r[2]} for r in rows]
+
+    def article_id(self, source):
+        with self._lock:
+            row = self._conn.execute("SELECT id FROM articles WHERE source = ?", (source,)).fetchone()
+        return row[0] if row else None
+
+    def add_article(self, source, chunks, vecs):
+        """Add an article's chunks and their normalized vectors, replacing any previous copy.
+
+        Re-adding a source with the same chunk texts is a no-op.
+        """
+        import faiss
+        vecs = np.ascontiguousarray(vecs, dtype="float32")
+        doc_key = document_key([c["text"] for c in chunks])
+        with self._lock:
+            row = self._conn.execute("SELECT id, doc_key FROM articles WHERE source = ?", (source,)).fetchone()
+            if row and row[1] == doc_key:
+                return row[0]
+            self._delete(source)
+            with self._conn:
+                article_id = self._conn.execute(
+                    "INSERT INTO articles (source, added, doc_key) VALUES (?, ?, ?)", (source, time.time(), doc_key)
+                ).lastrowid
+                start = self._conn.execute("SELECT COALESCE(MAX(id), -1) + 1 FROM chunks").fetchone()[0]
+                ids = np.arange(start, start + len(chunks), dtype="int64")
+                self._conn.executemany(
+                    "INSERT INTO chunks (id, article_id, chunk_id, text) VALUES (?, ?, ?, ?)",
+                    [(int(i), article_id, c["id"], c["text"]) for i, c in zip(ids, chunks)],
+                )
+            if self.index is None:
+                self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(vecs.shape[1]))
+            self.index.add_with_ids(vecs, ids)
+            if isinstance(self.index, faiss.IndexIDMap2) and self.index.ntotal >= self.ivf_threshold:
+                self._migrate_to_ivf()
+            self._save()
+        return article_id
+
+    def delete_article(self, source):
+        """Remove an article and all of its vectors. Returns False if it wasn't there."""
+        with self._lock:
+            removed = self._delete(source)
+            if removed:
+                self._save()
+        return removed
+
+    def _delete(self, source):
+        import faiss
+        article_id = self.article_id(source)
+        if article_id is None:
+            return False
+        ids = [r[0] for r in self._conn.execute("SELECT id FROM chunks WHERE article_id = ?", (article_id,))]
+        if ids and self.index is not None:
+            self.index.remove_ids(faiss.IDSelectorBatch(np.array(ids, dtype="int64")))
+        with self._conn:
+            self._conn.execute("DELETE FROM chunks WHERE article_id = ?", (article_id,))
+            self._conn.execute("DELETE FROM articles WHERE id = ?", (article_id,))
+        return True
+
+    def _migrate_to_ivf(self):
+        import faiss
+        n = self.index.ntotal
+        ids = faiss.vector_to_array(self.index.id_map).astype("int64")
+        vecs = self.index.index.reconstruct_n(0, n)
+        nlist = max(1, int(4 * np.sqrt(n)))
+        quantizer = faiss.IndexFlatIP(vecs.shape[1])
+        ivf = faiss.IndexIVFFlat(quantizer, vecs.shape[1], nlist, faiss.METRIC_INNER_PRODUCT)
+        ivf.train(vecs)
+        ivf.add_with_ids(vecs, ids)
+        self.index = ivf
+
+    def _save(self):
+        """Schedule a background write of the index."""
+        with self._lock:
+            self._dirty.set()
+            if self._saver is None:
+                self._saver = threading.Thread(target=self._save_loop, name="library-save", daemon=True)
+                self._saver.start()
+
+    def _save_loop(self):
+        while True:
+            # Coalesce a burst of changes into one write
+            time.sleep(self.save_delay)
+            self.flush()
+            with self._lock:
+                if not self._dirty.is_set():
+                    self._saver = None
+                    return
+
+    def flush(self):
+        """Write the index now if it has unsaved changes."""
+        import faiss
+        with self._write_lock:
+            with self._lock:
+                if not self._dirty.is_set():
+                    return
+                self._dirty.clear()
+                # Copy under the library lock (a memcpy); the disk write happens outside it
+                data = faiss.serialize_index(self.index) if self.index is not None else None
+            if data is None:
+                if os.path.exists(self.index_path):
+                    os.remove(self.index_path)
+                return
+            tmp = f"{self.index_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            data.tofile(tmp)
+            os.replace(tmp, self.index_path)
+
+    def search(self, query_vecs, k=5, article=None, exact=False):
+        """Search the library, optionally restricted to one article (by source).
+
+        Returns one list of hit dicts per query row, each with ``source``,
+        ``id`` (the chunk id within its article), ``text`` and ``score``.
+        """
+        import faiss
+        query_vecs = np.ascontiguousarray(query_vecs, dtype="float32")
+        with self._lock:
+            if not len(self):
+                return [[] for _ in range(len(query_vecs))]
+            sel = None
+            if article is not None:
+                article_id = self.article_id(article)
+                if article_id is None:
+                    return [[] for _ in range(len(query_vecs))]
+                ids = [r[0] for r in self._conn.execute("SELECT id FROM chunks WHERE article_id = ?", (article_id,))]
+                sel = faiss.IDSelectorBatch(np.array(ids, dtype="int64"))
+            if isinstance(self.index, faiss.IndexIVF):
+                params = faiss.SearchParametersIVF(sel=sel, nprobe=self.index.nlist if exact else self.nprobe)
+            else:
+                params = faiss.SearchParameters(sel=sel)
+            D, I = self.index.search(query_vecs, k, params=params)
+
+            found = {int(i) for i in I.ravel() if i >= 0}
+            marks = ",".join("?" * len(found))
+            meta = {r[0]: r[1:] for r in self._conn.execute(
+                f"""SELECT c.id, a.source, c.chunk_id, c.text FROM chunks c
+                    JOIN articles a ON a.id = c.article_id WHERE c.id IN ({marks})""", list(found))}
+        return [
+            [{"source": meta[i][0], "id": meta[i][1], "text": meta[i][2], "score": float(d)}
+             for d, i in zip(row_d, row_i) if i >= 0 and i in meta]
+            for row_d, row_i in zip(D, I)
+        ]
@@ -0,0 +1,56 @@
+def build_markdown(materials):
+    """Convert parsed StudyMaterials to formatted markdown."""
+    md = "# Spanish Study Materials\n\n"
+
+    for name, output in materials.raw.items():
+        md += f"## {name.title()}\n\n"
+        data = materials.payload(name)
+
+        if data is None:
+            md += f"```\n{output}\n```\n\n"
+
+        elif name == "vocab":
+            for item in data.vocabulary:
+                md += f"- **{item.spanish}** ({item.pos}) - {item.english}\n"
+                if item.example:
+                    md += f"  - *{item.example}*\n"
+            md += "\n"
+
+        elif name == "questions":
+            for i, q in enumerate(data.questions, 1):
+                md += f"{i}. **Q:** {q.question}\n"
+                md += f"   **A:** {q.answer}\n"
+                md += f"   *Difficulty: {q.difficulty}*\n\n"
+
+        elif name == "dialogue":
+            if data.title:
+                md += f"**{data.title}**\n\n"
+            for line in data.lines:
+                md += f"**{line.speaker}:** {line.es}\n\n"
+            if data.glossary:
+                md += "### Glossary\n\n"
+                for word in data.glossary:
+                    md += f"- {word.spanish} - {word.english}\n"
+            md += "\n"
+
+        elif name == "studyplan":
+            plan = data.plan
+            if plan.vocabulary:
+                md += "**Vocabulary:**\n"
+                for word in plan.vocabulary:
+                    md += f"- {word}\n"
+                md += "\n"
+            if plan.grammar:
+                md += "**Grammar:**\n"
+                for concept in plan.grammar:
+                    md += f"- {concept}\n"
+                md += "\n"
+            if plan.activities:
+                md += "**Activities:**\n"
+                for activity in plan.activities:
+                    md += f"- {activity}\n"
+                md += "\n"
+            if plan.timeline:
+                md += f"**Timeline:** {plan.timeline}\n\n"
+
+    return md
@@ -0,0 +1,157 @@
+import email.utils
+import random
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+class DeadlineExceeded(TimeoutError):
+    """The overall time budget for a call ran out; never retried."""
+
+class RetryPolicy:
+    """Jittered exponential backoff for transient API failures.
+
+    Retries rate limits (429), overloads (529), 5xx responses and connection
+    errors or timeouts. A ``retry-after`` header on the error response takes
+    precedence over the computed backoff. ``call`` can be given an overall
+    ``deadline`` (a ``time.monotonic()`` value) that attempts and backoff
+    sleeps together must fit in.
+    """
+
+    RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+    def __init__(self, max_retries=5, base_delay=1.0, max_delay=60.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def is_retryable(self, error):
+        if isinstance(error, DeadlineExceeded):
+            return False
+        status = getattr(error, "status_code", None)
+        if status is not None:
+            return status in self.RETRY_STATUSES
+        # Connection failures and timeouts from the SDK or requests carry no status
+        return any(name in type(error).__name__ for name in ("Connection", "Timeout"))
+
+    @staticmethod
+    def retry_after(error):
+        """Seconds the server asked us to wait, if it said."""
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None) or {}
+        value = headers.get("retry-after")
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            parsed = email.utils.parsedate_to_datetime(value)
+            return max(0.0, parsed.timestamp() - time.time()) if parsed else None
+
+    def delay_for(self, error, attempt):
+        """Seconds to wait before retry number ``attempt + 1``, or None to give up."""
+        if attempt >= self.max_retries or not self.is_retryable(error):
+            return None
+        server_delay = self.retry_after(error)
+        if server_delay is not None:
+            return min(server_delay, self.max_delay)
+        # "Full jitter": uniform in [0, base * 2^attempt], capped
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def call(self, fn, sleep=time.sleep, deadline=None):
+        attempt = 0
+        while True:
+            try:
+                return fn()
+            except Exception as e:
+                delay = self.delay_for(e, attempt)
+                if delay is None:
+                    raise
+                if deadline is not None and time.monotonic() + delay >= deadline:
+                    raise DeadlineExceeded(f"gave up after {attempt + 1} attempts: {e}") from e
+                attempt += 1
+                sleep(delay)
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at ``per_minute`` units per minute.
+
+    ``acquire`` blocks until enough units are available, or raises
+    DeadlineExceeded if they won't be before ``deadline`` (a
+    ``time.monotonic()`` value). A rate of 0 turns the bucket off.
+    ``adjust`` settles the difference once the real cost of a request is
+    known and may leave the bucket in debt.
+    """
+
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, n=1, deadline=None):
+        if not self.rate:
+            return
+        n = min(n, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= n:
+                    self.tokens -= n
+                    return
+                wait = (n - self.tokens) / self.rate
+            if deadline is not None and time.monotonic() + wait >= deadline:
+                raise DeadlineExceeded(f"rate limit wait of {wait:.1f}s would pass the deadline")
+            time.sleep(wait)
+
+    def adjust(self, n):
+        if not self.rate:
+            return
+        with self._lock:
+            self._refill()
+            self.tokens -= n
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into one execution.
+
+    The first caller for a key runs the function; callers arriving while it
+    is in flight wait for and share its result (or exception). A caller that
+    passes a ``deadline`` (a ``time.monotonic()`` value) stops waiting then
+    and gets DeadlineExceeded; the shared call carries on for the others.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def do(self, key, fn, deadline=None):
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                return future.result(timeout=timeout)
+            except FutureTimeout:
+                if future.done():
+                    raise
+                raise DeadlineExceeded("timed out waiting for an identical in-flight call") from None
+        try:
+            result = fn()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
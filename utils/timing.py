@@ -0,0 +1,33 @@
+import threading
+import time
+
+# Seconds since this module was first imported, which is close enough to process start
+_started = time.perf_counter()
+_timings = {}
+_lock = threading.Lock()
+
+def record(name, seconds):
+    """Record a one-off timing (the first value for a name wins)."""
+    with _lock:
+        _timings.setdefault(name, seconds)
+
+class timed:
+    """Context manager that records how long its block took under ``name``."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, time.perf_counter() - self.start)
+
+def since_start():
+    return time.perf_counter() - _started
+
+def timing_report():
+    """All recorded timings in seconds, in the order they were first recorded."""
+    with _lock:
+        return dict(_timings)
@@ -0,0 +1,192 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+# Latency histogram buckets in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_current = contextvars.ContextVar("current_span", default=None)
+
+class _NoopSpan:
+    """Returned by span() when tracing is off, so instrumented code costs almost nothing."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+    def inherited(self, key, default=None):
+        return default
+
+NOOP = _NoopSpan()
+
+class Span:
+    def __init__(self, tracer, name, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.parent = _current.get()
+        self.trace_id = self.parent.trace_id if self.parent else uuid.uuid4().hex[:16]
+        self.span_id = uuid.uuid4().hex[:16]
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self._t0
+        try:
+            _current.reset(self._token)
+        except ValueError:
+            # Closed from another context, e.g. a generator finalized elsewhere
+            pass
+        if exc_type is not None:
+            self.attrs["error"] = f"{exc_type.__name__}: {exc}"
+        self.tracer._finish(self)
+        return False
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def inherited(self, key, default=None):
+        """Look ``key`` up on this span, then on its ancestors."""
+        span = self
+        while span is not None:
+            if key in span.attrs:
+                return span.attrs[key]
+            span = span.parent
+        return default
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent else None,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": round(self.duration * 1000, 3),
+            **self.attrs,
+        }
+
+class Tracer:
+    """Timed spans for pipeline stages and LLM calls.
+
+    Finished spans are appended to ``jsonl_path`` (one JSON object each) and
+    aggregated into latency histograms, error counts and per-prompt token
+    counters that ``prometheus_text`` renders in the Prometheus text format.
+    When disabled, ``span`` returns a shared no-op object.
+    """
+
+    def __init__(self, enabled=False, jsonl_path=None, prometheus_path=None):
+        self.enabled = enabled
+        self.jsonl_path = jsonl_path
+        self.prometheus_path = prometheus_path
+        self._lock = threading.Lock()
+        self._export_lock = threading.Lock()
+        self._durations = defaultdict(lambda: [0] * (len(BUCKETS) + 1))
+        self._sums = defaultdict(float)
+        self._errors = defaultdict(int)
+        self._tokens = defaultdict(int)
+        self._llm_calls = defaultdict(int)
+        self._failed_paths = set()
+
+    def span(self, name, **attrs):
+        if not self.enabled:
+            return NOOP
+        return Span(self, name, attrs)
+
+    def current(self):
+        return _current.get() or NOOP
+
+    def _finish(self, span):
+        with self._lock:
+            counts = self._durations[span.name]
+            counts[next((i for i, b in enumerate(BUCKETS) if span.duration <= b), len(BUCKETS))] += 1
+            self._sums[span.name] += span.duration
+            if "error" in span.attrs:
+                self._errors[span.name] += 1
+            if span.name in ("llm.call", "llm.stream"):
+                labels = (span.inherited("prompt", "none"), span.attrs.get("model", ""))
+                self._llm_calls[labels + ("hit" if span.attrs.get("cache_hit") else "miss",)] += 1
+                for direction in ("input", "output"):
+                    self._tokens[labels + (direction,)] += span.attrs.get(f"{direction}_tokens", 0)
+            if self.jsonl_path:
+                try:
+                    with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n")
+                except OSError as e:
+                    # Tracing must never fail the traced request
+                    self._export_failed(self.jsonl_path, e)
+        # Refresh the metrics file whenever a whole trace finishes
+        if span.parent is None and self.prometheus_path:
+            self.write_prometheus(self.prometheus_path)
+
+    def prometheus_text(self):
+        lines = [
+            "# HELP holamundo_stage_duration_seconds Duration of pipeline stages and LLM calls.",
+            "# TYPE holamundo_stage_duration_seconds histogram",
+        ]
+        with self._lock:
+            for name, counts in sorted(self._durations.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ("+Inf",), counts):
+                    cumulative += count
+                    lines.append(f'holamundo_stage_duration_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'holamundo_stage_duration_seconds_sum{{stage="{name}"}} {self._sums[name]:.6f}')
+                lines.append(f'holamundo_stage_duration_seconds_count{{stage="{name}"}} {cumulative}')
+            lines += ["# HELP holamundo_stage_errors_total Stages that raised.", "# TYPE holamundo_stage_errors_total counter"]
+            for name, count in sorted(self._errors.items()):
+                lines.append(f'holamundo_stage_errors_total{{stage="{name}"}} {count}')
+            lines += ["# HELP holamundo_llm_calls_total LLM calls by prompt, model and cache result.", "# TYPE holamundo_llm_calls_total counter"]
+            for (prompt, model, cache), count in sorted(self._llm_calls.items()):
+                lines.append(f'holamundo_llm_calls_total{{prompt="{prompt}",model="{model}",cache="{cache}"}} {count}')
+            lines += ["# HELP holamundo_llm_tokens_total LLM tokens by prompt, model and direction.", "# TYPE holamundo_llm_tokens_total counter"]
+            for (prompt, model, direction), count in sorted(self._tokens.items()):
+                lines.append(f'holamundo_llm_tokens_total{{prompt="{prompt}",model="{model}",direction="{direction}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """Atomically replace ``path`` with the current metrics; errors are logged, not raised."""
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with self._export_lock:
+                with open(tmp, "w", encoding="utf-8") as f:
+                    f.write(self.prometheus_text())
+                os.replace(tmp, path)
+        except OSError as e:
+            self._export_failed(path, e)
+
+    def _export_failed(self, path, error):
+        # Warn once per path: an unwritable TRACE_JSONL would otherwise log every span.
+        # No lock, since callers may hold either of ours; a race costs one extra warning.
+        if path in self._failed_paths:
+            return
+        self._failed_paths.add(path)
+        logger.warning("tracing: couldn't write %s, further errors for it won't be logged: %s", path, error)
+
+def propagate(fn):
+    """Wrap ``fn`` to run in a copy of the current context, so spans opened in
+    worker threads nest under the span that submitted them."""
+    ctx = contextvars.copy_context()
+    return lambda *args, **kwargs: ctx.run(fn, *args, **kwargs)
+
+# TRACE_JSONL / TRACE_PROMETHEUS turn tracing on and choose where it is exported
+tracer = Tracer(
+    enabled=bool(os.getenv("TRACE_JSONL") or os.getenv("TRACE_PROMETHEUS")),
+    jsonl_path=os.getenv("TRACE_JSONL"),
+    prometheus_path=os.getenv("TRACE_PROMETHEUS"),
+)
+span = tracer.span